@@ -3,10 +3,10 @@ from sqlalchemy.orm import Session
 from models.models import Base
 from models.fitness import Workout as DBWorkout, Appointment as DBAppointment, BlockedTime as DBBlockedTime, Message as DBMessage, ProgressEntry as DBProgressEntry
 from settings.database import engine
+from settings.migrations import run_migrations
 from routers import auth, blogs, notifications, products, order, users
-from routers import workouts, calendar, progress, messages, streaks
+from routers import workouts, calendar, progress, messages, streaks, uploads
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 
 # Create uploads directory if it doesn't exist
@@ -25,6 +25,7 @@ app.add_middleware(
 )
 
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
 
 app.include_router(auth.router)
 app.include_router(users.router)
@@ -37,9 +38,8 @@ app.include_router(calendar.router)
 app.include_router(progress.router)
 app.include_router(messages.router)
 app.include_router(streaks.router)
-
-# Mount the uploads directory for serving static files
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Serves the uploads directory (ETags, 304s, Range requests, caching)
+app.include_router(uploads.router)
 
 # Entry point for the application
 
@@ -1,5 +1,5 @@
 from settings.database import Base
-from sqlalchemy import Column, String, Integer, Boolean, Text
+from sqlalchemy import Column, String, Integer, Boolean, Text, DateTime, Index
 from sqlalchemy.dialects.sqlite import JSON
 
 
@@ -9,11 +9,50 @@ class Workout(Base):
     name = Column(String)
     description = Column(Text)
     exercises = Column(JSON)  # List of workout exercises
-    createdAt = Column(String)
+    createdAt = Column(DateTime)
     createdBy = Column(String)
     duration = Column(Integer)
     difficulty = Column(String)
 
+    # Filtered library listings page by id within each filter combination
+    __table_args__ = (
+        Index('ix_workouts_creator_id', 'createdBy', 'id'),
+        Index('ix_workouts_difficulty_id', 'difficulty', 'id'),
+        Index('ix_workouts_creator_difficulty_id', 'createdBy', 'difficulty', 'id'),
+    )
+
+
+class WorkoutCompletion(Base):
+    __tablename__ = 'workout_completions'
+    id = Column(Integer, primary_key=True, index=True)
+    workoutId = Column(String)
+    userId = Column(String)
+    completedAt = Column(DateTime)
+    # Copied from the workout at completion time so history stays stable
+    duration = Column(Integer)
+    difficulty = Column(String)
+
+    __table_args__ = (
+        Index('ix_workout_completions_user_completed', 'userId', 'completedAt'),
+    )
+
+
+class WorkoutCompletionStats(Base):
+    # Running totals per user, period ('week' | 'month') and difficulty,
+    # incremented on every completion
+    __tablename__ = 'workout_completion_stats'
+    id = Column(Integer, primary_key=True, index=True)
+    userId = Column(String, nullable=False)
+    period = Column(String, nullable=False)
+    periodKey = Column(String, nullable=False)  # '2024-W07' | '2024-02'
+    difficulty = Column(String, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    totalMinutes = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ux_workout_completion_stats_key', 'userId', 'period', 'periodKey', 'difficulty', unique=True),
+    )
+
 
 class Appointment(Base):
     __tablename__ = 'appointments'
@@ -22,44 +61,90 @@ class Appointment(Base):
     clientId = Column(String)
     title = Column(String)
     description = Column(Text)
-    startTime = Column(String)
-    endTime = Column(String)
+    startTime = Column(DateTime)
+    endTime = Column(DateTime)
     status = Column(String)
     location = Column(String)
     notes = Column(Text)
 
+    # Range listings scan by start; overlap checks scan appointments ending after a point
+    __table_args__ = (
+        Index('ix_appointments_trainer_start', 'trainerId', 'startTime'),
+        Index('ix_appointments_client_start', 'clientId', 'startTime'),
+        Index('ix_appointments_trainer_end', 'trainerId', 'endTime'),
+        Index('ix_appointments_client_end', 'clientId', 'endTime'),
+        # Day and range views across all trainers
+        Index('ix_appointments_start', 'startTime'),
+    )
+
 
 class BlockedTime(Base):
     __tablename__ = 'blocked_times'
     id = Column(String, primary_key=True, index=True)
     trainerId = Column(String)
-    startTime = Column(String)
-    endTime = Column(String)
+    startTime = Column(DateTime)
+    endTime = Column(DateTime)
     isFullDay = Column(Boolean, default=False)
     reason = Column(String)
 
+    __table_args__ = (
+        Index('ix_blocked_times_trainer_start', 'trainerId', 'startTime'),
+        Index('ix_blocked_times_trainer_end', 'trainerId', 'endTime'),
+        Index('ix_blocked_times_start', 'startTime'),
+    )
+
 
 class Message(Base):
     __tablename__ = 'messages'
     id = Column(String, primary_key=True, index=True)
     senderId = Column(String)
     receiverId = Column(String)
+    conversationKey = Column(String)  # Unordered sender/receiver pair, see services.conversations
     content = Column(Text)
-    timestamp = Column(String)
+    timestamp = Column(DateTime)
     read = Column(Boolean, default=False)
     attachments = Column(JSON)  # List of attachments
 
+    __table_args__ = (
+        Index('ix_messages_sender_receiver_timestamp', 'senderId', 'receiverId', 'timestamp'),
+        Index('ix_messages_conversation_timestamp', 'conversationKey', 'timestamp', 'id'),
+        Index('ix_messages_receiver_read', 'receiverId', 'read'),
+        # Keyset pages over all messages
+        Index('ix_messages_timestamp_id', 'timestamp', 'id'),
+    )
+
+
+class UnreadCounter(Base):
+    __tablename__ = 'unread_counters'
+    receiverId = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
 
 class ProgressEntry(Base):
     __tablename__ = 'progress_entries'
     id = Column(String, primary_key=True, index=True)
     clientId = Column(String)
-    date = Column(String)
+    date = Column(DateTime)
     type = Column(String)  # 'photo' | 'measurement' | 'note'
     photos = Column(JSON)  # List of URLs
+    photoVariants = Column(JSON)  # Per photo: {variant name: URL}
     measurements = Column(JSON)  # Measurements object
     notes = Column(Text)
 
+    __table_args__ = (
+        Index('ix_progress_entries_client_date_type', 'clientId', 'date', 'type'),
+        Index('ix_progress_entries_client_type_date', 'clientId', 'type', 'date', 'id'),
+    )
+
+
+class LatestMeasurement(Base):
+    # Pointer to (and copy of) each client's most recent measurement entry
+    __tablename__ = 'latest_measurements'
+    clientId = Column(String, primary_key=True)
+    entryId = Column(String, nullable=False)
+    date = Column(DateTime)
+    measurements = Column(JSON)
+
 
 class Exercise(Base):
     __tablename__ = 'exercises'
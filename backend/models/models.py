@@ -1,5 +1,5 @@
 from settings.database import Base
-from sqlalchemy import Column, ForeignKey, Integer, String, Boolean, Numeric, TIMESTAMP, func
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, Boolean, Numeric, TIMESTAMP, func
 
 class Products(Base):
     __tablename__ = 'products'
@@ -23,6 +23,27 @@ class Blogs(Base):
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
 
+    __table_args__ = (
+        # Keyset pagination of the feed, newest first
+        Index('ix_blogs_created_at_id', 'created_at', 'id'),
+    )
+
+class BlogTags(Base):
+    # Normalized tags parsed from Blogs.tags (services/blog_tags.py)
+    __tablename__ = 'blog_tags'
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False, unique=True)
+
+class BlogTagLinks(Base):
+    __tablename__ = 'blog_tag_links'
+    blog_id = Column(Integer, ForeignKey("blogs.id", ondelete="CASCADE"), primary_key=True)
+    tag_id = Column(Integer, ForeignKey("blog_tags.id", ondelete="CASCADE"), primary_key=True)
+
+    __table_args__ = (
+        # Posts for a tag, and counts per tag, straight from the index
+        Index('ix_blog_tag_links_tag_blog', 'tag_id', 'blog_id'),
+    )
+
 class Orders(Base):
     __tablename__ = 'orders'
     id = Column(Integer, primary_key=True, index=True)
@@ -35,3 +56,9 @@ class Orders(Base):
     tracking_number = Column(String)
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+
+class StoredFiles(Base):
+    # Reference counts for the content-addressed upload store (services/uploads.py)
+    __tablename__ = 'stored_files'
+    url = Column(String, primary_key=True)
+    ref_count = Column(Integer, nullable=False, default=0)
@@ -1,14 +1,20 @@
 from datetime import timedelta, timezone, datetime
 from typing_extensions import Annotated
-from fastapi import APIRouter, Depends, status, HTTPException
+from fastapi import APIRouter, Depends, Request, status, HTTPException
 from pydantic import BaseModel
 from models.users import User
-from sqlalchemy import or_
+from sqlalchemy import or_, select
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
-from settings.database import SessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+from settings.database import get_async_db
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from jose import jwt, JWTError
+from services.hash_pool import HashPool, PoolSaturated
+from services.throttle import AttemptLimiter
+from services.ttl_cache import TTLCache
+import math
+import os
+import time
 
 router = APIRouter(
     prefix="/auth",
@@ -22,14 +28,51 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl='auth/token')
 
-def autenticate_user(username: str, password: str, db):
+# Verified token -> claims; an entry never outlives the token's own exp
+TOKEN_CACHE = TTLCache(max_entries=10_000, ttl=5 * 60)
+# user id -> public profile fields. Short-lived so other workers' updates
+# show up quickly; this worker's own updates call invalidate_user_context
+USER_CONTEXT_CACHE = TTLCache(max_entries=10_000, ttl=30)
+
+# bcrypt runs off the event loop on a bounded pool; when it is saturated
+# requests get a 429 instead of waiting in an ever longer queue
+HASH_POOL = HashPool(
+    workers=int(os.getenv("KOWKA_HASH_WORKERS", min(4, os.cpu_count() or 1))),
+    max_queue=int(os.getenv("KOWKA_HASH_QUEUE", 32)),
+)
+# Failed password checks allowed per account / per client IP in 5 minutes.
+# Accounts are keyed by user id, so username and email share one budget
+ACCOUNT_ATTEMPTS = AttemptLimiter(max_attempts=5, window=5 * 60)
+IP_ATTEMPTS = AttemptLimiter(max_attempts=20, window=5 * 60)
+
+def _too_many_requests(retry_after: float):
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many attempts. Please try again later.",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+async def _run_hash(fn, *args):
+    try:
+        return await HASH_POOL.run(fn, *args)
+    except PoolSaturated:
+        raise _too_many_requests(1)
+
+async def hash_password(password: str) -> str:
+    return await _run_hash(bcrypt_context.hash, password)
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    return await _run_hash(bcrypt_context.verify, password, hashed_password)
+
+def _check_attempts(*limited):
+    # limited: (limiter, key) pairs; raises while any key is blocked
+    retry_after = max(limiter.retry_after(key) for limiter, key in limited)
+    if retry_after > 0:
+        raise _too_many_requests(retry_after)
+
+async def _find_user(username: str, db: AsyncSession):
     # Accept either username or email in the OAuth2 "username" field
-    user = db.query(User).filter(or_(User.username == username, User.email == username)).first()
-    if not user:
-        return False
-    if not bcrypt_context.verify(password, user.hashed_password):
-        return False
-    return user
+    return await db.scalar(select(User).where(or_(User.username == username, User.email == username)).limit(1))
 
 def create_access_token(username: str, user_id: int, expires_delta=timedelta):
     encode = {'sub': username, 'id': user_id}
@@ -38,6 +81,9 @@ def create_access_token(username: str, user_id: int, expires_delta=timedelta):
     return jwt.encode(encode, SECRET_KEY, algorithm=ALGORITHM)
 
 async def get_current_user(token: Annotated[str, Depends(oauth2_bearer)]):
+    claims = TOKEN_CACHE.get(token)
+    if claims is not None:
+        return claims
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -47,7 +93,9 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_bearer)]):
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
     
-    return {"username": username, "user_id": user_id}
+    claims = {"username": username, "user_id": user_id}
+    TOKEN_CACHE.set(token, claims, ttl=payload["exp"] - time.time() if "exp" in payload else None)
+    return claims
 
 class CreateUserRequest(BaseModel):
     username: str
@@ -72,14 +120,34 @@ class Token(BaseModel):
     access_token: str
     token_type: str
     
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
+
+def _user_context(user_model: User) -> dict:
+    return {
+        "id": user_model.id,
+        "username": user_model.username,
+        "email": user_model.email,
+        "first_name": user_model.first_name,
+        "last_name": user_model.last_name,
+        "role": user_model.role,
+        "profile_picture": user_model.profile_picture
+    }
+
+async def get_user_context(user: Annotated[dict, Depends(get_current_user)], db: db_dependency):
+    # FastAPI resolves a dependency once per request; across requests the
+    # row is served from USER_CONTEXT_CACHE for a few seconds
+    context = USER_CONTEXT_CACHE.get(user["user_id"])
+    if context is not None:
+        return context
+    user_model = await db.get(User, user["user_id"])
+    if user_model is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    context = _user_context(user_model)
+    USER_CONTEXT_CACHE.set(user_model.id, context)
+    return context
 
-db_dependency = Annotated[Session, Depends(get_db)]
+def invalidate_user_context(user_id: int):
+    USER_CONTEXT_CACHE.pop(user_id)
 
 @router.post("/register", status_code=status.HTTP_201_CREATED)
 async def create_user(db: db_dependency, 
@@ -89,16 +157,16 @@ async def create_user(db: db_dependency,
         username=create_user_request.username,
         first_name=create_user_request.first_name,
         last_name=create_user_request.last_name,
-        hashed_password=bcrypt_context.hash(create_user_request.password),
+        hashed_password=await hash_password(create_user_request.password),
         is_active=True,
         role=create_user_request.role
     )
 
     db.add(create_user_model)
-    db.commit()
+    await db.commit()
 
     if create_user_model is not None:
-        return create_user_model
+        return _user_context(create_user_model)
     raise HTTPException(status_code=400, detail="User creation failed.")
 
 @router.put("/update", status_code=status.HTTP_200_OK)
@@ -108,7 +176,7 @@ async def update_user(user: Annotated[dict, Depends(get_current_user)],
     if user is None:
         raise HTTPException(status_code=401, detail="Authentication required")
         
-    user_model = db.query(User).filter(User.id == user["user_id"]).first()
+    user_model = await db.get(User, user["user_id"])
     if user_model is None:
         raise HTTPException(status_code=404, detail="User not found")
     user_model.username = update_user_request.username
@@ -116,8 +184,9 @@ async def update_user(user: Annotated[dict, Depends(get_current_user)],
     user_model.first_name = update_user_request.first_name
     user_model.last_name = update_user_request.last_name
     user_model.role = update_user_request.role
-    db.commit()
-    return user_model
+    await db.commit()
+    invalidate_user_context(user_model.id)
+    return _user_context(user_model)
 
 @router.put("/change_password", status_code=status.HTTP_200_OK)
 async def change_password(user: Annotated[dict, Depends(get_current_user)],
@@ -126,29 +195,47 @@ async def change_password(user: Annotated[dict, Depends(get_current_user)],
     if user is None:
         raise HTTPException(status_code=401, detail="Authentication required")
         
-    user_model = db.query(User).filter(User.id == user["user_id"]).first()
+    user_model = await db.get(User, user["user_id"])
     if user_model is None:
         raise HTTPException(status_code=404, detail="User not found")
         
     # Verify current password
-    if not bcrypt_context.verify(change_password_request.password, user_model.hashed_password):
+    _check_attempts((ACCOUNT_ATTEMPTS, user_model.id))
+    if not await verify_password(change_password_request.password, user_model.hashed_password):
+        ACCOUNT_ATTEMPTS.record_failure(user_model.id)
         raise HTTPException(status_code=401, detail="Current password is incorrect")
         
     # Update password
-    user_model.hashed_password = bcrypt_context.hash(change_password_request.new_password)
-    db.commit()
+    user_model.hashed_password = await hash_password(change_password_request.new_password)
+    await db.commit()
+    invalidate_user_context(user_model.id)
     return {"message": "Password updated successfully"}
 
 @router.post("/token", response_model=Token, status_code=status.HTTP_200_OK)
 async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-                                 db: db_dependency):
-    authentication = autenticate_user(form_data.username, form_data.password, db)
-    if not authentication:
+                                 db: db_dependency,
+                                 request: Request):
+    # Throttled before hashing, so blocked attempts cost no bcrypt time
+    client_ip = request.client.host if request.client else "unknown"
+    _check_attempts((IP_ATTEMPTS, client_ip))
+    authentication = await _find_user(form_data.username, db)
+    if authentication is not None:
+        _check_attempts((ACCOUNT_ATTEMPTS, authentication.id))
+    if authentication is None or not await verify_password(form_data.password, authentication.hashed_password):
+        if authentication is not None:
+            ACCOUNT_ATTEMPTS.record_failure(authentication.id)
+        IP_ATTEMPTS.record_failure(client_ip)
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    ACCOUNT_ATTEMPTS.reset(authentication.id)
     
     token = create_access_token(
         username=authentication.username,
         user_id=authentication.id,
         expires_delta=timedelta(minutes=30)
     )
-    return {"access_token": token, "token_type": "bearer"}
\ No newline at end of file
+    return {"access_token": token, "token_type": "bearer"}
+
+@router.get("/metrics/hashing", status_code=status.HTTP_200_OK, dependencies=[Depends(get_current_user)])
+async def hashing_metrics():
+    # Pool saturation plus wait/hash latency (ms) over recent hashes
+    return HASH_POOL.metrics()
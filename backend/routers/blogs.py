@@ -1,33 +1,74 @@
-from fastapi import APIRouter, Depends, HTTPException, Path, status, File, UploadFile
-from typing import Annotated
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, status, File, UploadFile
+from typing import Annotated, List, Optional
+from datetime import datetime
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
-from models.models import Blogs
-from settings.database import engine, SessionLocal
+from sqlalchemy import and_, delete, literal_column, or_, select, table, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+from models.models import Blogs, BlogTagLinks, BlogTags
+from settings.database import get_async_db, get_async_read_db
 from .auth import get_current_user
-import shutil
-import os
-from pathlib import Path
-import uuid
+from services import blog_tags, uploads
+from services.images import create_variants
+from services.response_cache import ResponseCache
+from services.ttl_cache import TTLCache
+import re
 
 router = APIRouter(
     prefix="/blogs",
     tags=["blogs"]
 )
 
-# Create uploads directory for blog images if it doesn't exist
-BLOG_UPLOADS_DIR = Path("uploads/blog_images")
-BLOG_UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
+# Stored uploads referenced from a blog's content (originals, not variants)
+STORED_IMAGE_URL = re.compile(re.escape(uploads.STORE_URL) + r"/[0-9a-f]{2}/[0-9a-f]{64}\.(?:jpg|png|gif|webp)\b")
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
 
-db_dependency = Annotated[Session, Depends(get_db)]
+# Public reads, served from memory until a write here invalidates them; the
+# TTL bounds how stale other workers' copies can get
+RESPONSE_CACHE = ResponseCache(max_entries=1000, ttl=60)
+
+# Tag -> post counts for /blogs/tags. This worker's writes invalidate it;
+# the TTL bounds how long other workers' writes take to show up
+TAG_COUNTS_CACHE = TTLCache(max_entries=1, ttl=60)
+
+# The feed only needs these; content bodies stay out of listings
+SUMMARY_COLUMNS = (Blogs.id, Blogs.title, Blogs.description, Blogs.author, Blogs.tags, Blogs.created_at)
+
+
+def _image_urls(content: str):
+    return STORED_IMAGE_URL.findall(content or "")
+
+def invalidate_tag_counts():
+    TAG_COUNTS_CACHE.pop("all")
+
+def invalidate_blog(blog_id: Optional[int] = None):
+    # Any listing page may include the post, so all of them go
+    RESPONSE_CACHE.invalidate_route("all_blogs")
+    if blog_id is not None:
+        RESPONSE_CACHE.invalidate("single_blog", blog_id)
+
+def _search_filter(db: AsyncSession, q: str):
+    # Every word must match (as a prefix); quoting each term keeps user
+    # input from being parsed as FTS5 query syntax
+    words = re.findall(r"\w+", q)
+    if not words:
+        return Blogs.id.is_(None)
+    if db.bind.dialect.name == "sqlite":
+        match = " ".join(f'"{word}"*' for word in words)
+        matching_ids = (
+            select(literal_column("rowid"))
+            .select_from(table("blogs_fts"))
+            .where(text("blogs_fts MATCH :match").bindparams(match=match))
+        )
+        return Blogs.id.in_(matching_ids)
+    searchable = (Blogs.title, Blogs.description, Blogs.content, Blogs.author, Blogs.tags)
+    return and_(*(or_(*(column.ilike(f"%{word}%") for column in searchable)) for word in words))
+
+db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
+read_db_dependency = Annotated[AsyncSession, Depends(get_async_read_db)]
 user_dependencty = Annotated[dict, Depends(get_current_user)]
 
 class BlogRequest(BaseModel):
@@ -37,15 +78,67 @@ class BlogRequest(BaseModel):
     author: str = Field(min_length=3, max_length=50)
     tags: str = Field(min_length=3)
 
-@router.get("", status_code=status.HTTP_200_OK)
-async def all_blogs(db: db_dependency):
-    return db.query(Blogs).all()
+class BlogSummary(BaseModel):
+    id: int
+    title: Optional[str] = None
+    description: Optional[str] = None
+    author: Optional[str] = None
+    tags: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+@router.get("", response_model=List[BlogSummary], status_code=status.HTTP_200_OK)
+async def all_blogs(db: read_db_dependency,
+                    request: Request,
+                    q: Optional[str] = None,
+                    tag: Optional[str] = None,
+                    cursor: Optional[int] = None,
+                    limit: int = Query(default=DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE)):
+    # Newest first; pass the last id of a page as the next cursor
+    tag = blog_tags.normalize_tag(tag) if tag is not None else None
+    cache_key = RESPONSE_CACHE.key("all_blogs", q, tag, cursor, limit)
+    cached = RESPONSE_CACHE.get(cache_key)
+    if cached is not None:
+        return cached.respond(request)
+    query = select(*SUMMARY_COLUMNS)
+    if q:
+        query = query.where(_search_filter(db, q))
+    if tag is not None:
+        # Served from the (tag_id, blog_id) index instead of LIKE on Blogs.tags
+        query = (
+            query.join(BlogTagLinks, BlogTagLinks.blog_id == Blogs.id)
+            .join(BlogTags, BlogTags.id == BlogTagLinks.tag_id)
+            .where(BlogTags.name == tag)
+        )
+    if cursor is not None:
+        if await db.scalar(select(Blogs.id).where(Blogs.id == cursor)) is None:
+            raise HTTPException(status_code=404, detail="Cursor blog not found")
+        # Compare against the stored value itself: server-default timestamps
+        # have no fractional seconds, so a re-bound datetime wouldn't match
+        cursor_blog = aliased(Blogs)
+        cursor_created_at = select(cursor_blog.created_at).where(cursor_blog.id == cursor).scalar_subquery()
+        query = query.where(tuple_(Blogs.created_at, Blogs.id) < tuple_(cursor_created_at, cursor))
+    query = query.order_by(Blogs.created_at.desc(), Blogs.id.desc()).limit(limit)
+    blogs = [BlogSummary(**row._asdict()) for row in (await db.execute(query)).all()]
+    return RESPONSE_CACHE.put(cache_key, blogs).respond(request)
+
+@router.get("/tags", status_code=status.HTTP_200_OK)
+async def all_tags(db: read_db_dependency):
+    counts = TAG_COUNTS_CACHE.get("all")
+    if counts is None:
+        counts = await db.run_sync(blog_tags.tag_counts)
+        TAG_COUNTS_CACHE.set("all", counts)
+    return counts
 
 @router.get("/{blog_id}", status_code=status.HTTP_200_OK)
-async def single_blog(db: db_dependency, blog_id: int = Path(gt=0)):
-    blog_model = db.query(Blogs).filter(Blogs.id == blog_id).first()
+async def single_blog(db: read_db_dependency, request: Request, blog_id: int = Path(gt=0)):
+    cache_key = RESPONSE_CACHE.key("single_blog", blog_id)
+    cached = RESPONSE_CACHE.get(cache_key)
+    if cached is not None:
+        return cached.respond(request)
+    blog_model = await db.get(Blogs, blog_id)
     if blog_model is not None:
-        return blog_model
+        cached = RESPONSE_CACHE.put(cache_key, blog_model, last_modified=blog_model.updated_at)
+        return cached.respond(request)
     raise HTTPException(status_code=404, detail="Blog not found")
 
 @router.post("/new_blog", status_code=status.HTTP_201_CREATED)
@@ -54,37 +147,58 @@ async def create_blog(db: db_dependency, user: user_dependencty, blog_request: B
         raise HTTPException(status_code=401, detail="Authentication failed")
     blog_model = Blogs(**blog_request.dict(), owner_id=user.get("id"))
     db.add(blog_model)
-    db.commit()
+    # Flushed first so the tag links have the new id to point at
+    await db.flush()
+    await db.run_sync(blog_tags.set_tags, blog_model.id, blog_model.tags)
+    await db.run_sync(uploads.retain, _image_urls(blog_model.content))
+    await db.commit()
+    invalidate_tag_counts()
+    invalidate_blog()
+    # Loads the server-side created_at/updated_at defaults
+    await db.refresh(blog_model)
     return blog_model
 
 @router.put("/{blog_id}", status_code=status.HTTP_200_OK)
 async def update_blog(db: db_dependency, user: user_dependencty, blog_request: BlogRequest, blog_id: int = Path(gt=0)):
     if user is None:
         raise HTTPException(status_code=401, detail="Authentication failed")
-    blog_model = db.query(Blogs).filter(Blogs.id == blog_id).first()
+    blog_model = await db.get(Blogs, blog_id)
     if blog_model is None:
         raise HTTPException(status_code=404, detail="Blog not found")
     if blog_model.owner_id != user.get("id"):
         raise HTTPException(status_code=403, detail="You are not authorized to update this blog")
+    # Images dropped from the content are released, newly embedded ones retained
+    await db.run_sync(uploads.retain, _image_urls(blog_request.content))
+    orphaned = await db.run_sync(uploads.release, _image_urls(blog_model.content))
     blog_model.title = blog_request.title
     blog_model.description = blog_request.description
     blog_model.content = blog_request.content
     blog_model.author = blog_request.author
     blog_model.tags = blog_request.tags
-    db.commit()
+    await db.run_sync(blog_tags.set_tags, blog_id, blog_request.tags)
+    await db.commit()
+    invalidate_tag_counts()
+    invalidate_blog(blog_id)
+    await db.refresh(blog_model)
+    uploads.collect(orphaned)
     return blog_model
 
 @router.delete("/{blog_id}", status_code=status.HTTP_200_OK)
 async def delete_blog(db: db_dependency, user: user_dependencty, blog_id: int = Path(gt=0)):
     if user is None:
         raise HTTPException(status_code=401, detail="Authentication failed")
-    blog_model = db.query(Blogs).filter(Blogs.id == blog_id).first()
+    blog_model = await db.get(Blogs, blog_id)
     if blog_model is None:
         raise HTTPException(status_code=404, detail="Blog not found")
     if blog_model.owner_id != user.get("id"):
         raise HTTPException(status_code=403, detail="You are not authorized to delete this blog")
-    db.query(Blogs).filter(Blogs.id == blog_id).delete()
-    db.commit()
+    orphaned = await db.run_sync(uploads.release, _image_urls(blog_model.content))
+    await db.run_sync(blog_tags.clear_tags, blog_id)
+    await db.execute(delete(Blogs).where(Blogs.id == blog_id))
+    await db.commit()
+    invalidate_tag_counts()
+    invalidate_blog(blog_id)
+    uploads.collect(orphaned)
     return {"status": "success", "message": "Blog deleted successfully"}
 
 @router.post("/upload-image", status_code=status.HTTP_200_OK)
@@ -94,20 +208,9 @@ async def upload_blog_image(user: user_dependencty,
     if user is None:
         raise HTTPException(status_code=401, detail="Authentication failed")
     
-    # Validate file type
-    valid_content_types = ["image/jpeg", "image/png", "image/gif", "image/webp"]
-    if file.content_type not in valid_content_types:
-        raise HTTPException(status_code=400, detail="Invalid file type. Only JPEG, PNG, GIF, and WebP are allowed.")
-    
-    # Create a unique filename
-    file_extension = file.filename.split(".")[-1]
-    unique_id = str(uuid.uuid4())
-    filename = f"blog_{unique_id}.{file_extension}"
-    file_path = BLOG_UPLOADS_DIR / filename
-    
-    # Save the file
-    with file_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Validates the type from the file contents and saves it off the event loop
+    url = await uploads.save_image(file, allowed=("jpg", "png", "gif", "webp"))
+    variants = await create_variants(uploads.path_for(url), url)
     
     # Return the URL to the uploaded image
-    return {"image_url": f"/uploads/blog_images/{filename}"}
\ No newline at end of file
+    return {"image_url": url, "variants": variants}
\ No newline at end of file
@@ -1,7 +1,16 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from pydantic import BaseModel
 from typing import List, Optional
+from typing_extensions import Annotated
 from datetime import datetime, timedelta
+from sqlalchemy import or_, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from models.fitness import Appointment as DBAppointment, BlockedTime as DBBlockedTime
+from settings.database import get_db, get_read_db
+from services.availability import free_windows, full_day_span, merge_busy, split_slots
+from services.ids import new_id
+from services.timeutils import parse_param, start_of_day, to_iso
 
 
 router = APIRouter(
@@ -9,6 +18,9 @@ router = APIRouter(
     tags=["calendar"],
 )
 
+db_dependency = Annotated[Session, Depends(get_db)]
+read_db_dependency = Annotated[Session, Depends(get_read_db)]
+
 
 class Appointment(BaseModel):
     id: str
@@ -61,157 +73,321 @@ class CreateBlockedTimeRequest(BaseModel):
     reason: Optional[str] = None
 
 
-APPOINTMENTS: List[Appointment] = []
-BLOCKED_TIMES: List[BlockedTime] = []
+class AvailabilitySlot(BaseModel):
+    startTime: str
+    endTime: str
+
+
+class Availability(BaseModel):
+    trainerId: str
+    slotMinutes: int
+    freeWindows: List[AvailabilitySlot]
+    slots: List[AvailabilitySlot]
+
+
+MAX_AVAILABILITY_WINDOW = timedelta(days=62)
+
+
+def _to_appointment(row: DBAppointment) -> Appointment:
+    return Appointment(
+        id=row.id,
+        trainerId=row.trainerId,
+        clientId=row.clientId,
+        title=row.title,
+        description=row.description,
+        startTime=to_iso(row.startTime),
+        endTime=to_iso(row.endTime),
+        status=row.status,
+        location=row.location,
+        notes=row.notes,
+    )
+
+
+def _to_blocked_time(row: DBBlockedTime) -> BlockedTime:
+    return BlockedTime(
+        id=row.id,
+        trainerId=row.trainerId,
+        startTime=to_iso(row.startTime),
+        endTime=to_iso(row.endTime),
+        isFullDay=bool(row.isFullDay),
+        reason=row.reason,
+    )
+
+
+def _parse_day(value: str, field: str = "date") -> datetime:
+    return parse_param(value, field, start_of_day)
+
+
+def _parse_span(start_time: str, end_time: str):
+    start = parse_param(start_time, "startTime")
+    end = parse_param(end_time, "endTime")
+    if end <= start:
+        raise HTTPException(status_code=400, detail="End time must be after start time")
+    return start, end
+
+
+def _parse_range(from_: str, to: str):
+    start = parse_param(from_, "from")
+    end = parse_param(to, "to")
+    if end <= start:
+        raise HTTPException(status_code=400, detail="'to' must be after 'from'")
+    return start, end
+
+
+def _busy_appointments(db: Session, user_filter, start: datetime, end: datetime, exclude_id: Optional[str] = None):
+    query = db.query(DBAppointment.startTime, DBAppointment.endTime).filter(
+        user_filter,
+        DBAppointment.endTime > start,
+        DBAppointment.startTime < end,
+        DBAppointment.status != "cancelled",
+    )
+    if exclude_id is not None:
+        query = query.filter(DBAppointment.id != exclude_id)
+    return [tuple(r) for r in query.order_by(DBAppointment.startTime).all()]
+
+
+def _busy_blocks(db: Session, trainer_id: str, start: datetime, end: datetime):
+    query = db.query(DBBlockedTime.startTime, DBBlockedTime.endTime).filter(
+        DBBlockedTime.trainerId == trainer_id,
+        DBBlockedTime.endTime > start,
+        DBBlockedTime.startTime < end,
+    )
+    return [tuple(r) for r in query.order_by(DBBlockedTime.startTime).all()]
+
+
+def _lock_schedules(db: Session, *user_ids: str):
+    """Serialize writes that touch the same trainer's or client's schedule.
+
+    Called before the overlap checks, so the check and the insert/update
+    happen under one lock and two workers can't both book the same slot.
+    """
+    dialect = db.get_bind().dialect.name
+    try:
+        if dialect == "sqlite":
+            # Take the database write lock up front instead of at the INSERT
+            db.execute(text("BEGIN IMMEDIATE"))
+        elif dialect == "postgresql":
+            # Sorted, so two transactions never wait on each other's locks
+            for user_id in sorted(set(user_ids)):
+                db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": f"schedule:{user_id}"})
+    except OperationalError:
+        # Still locked after busy_timeout
+        raise HTTPException(status_code=409, detail="The schedule is being changed, please try again")
+
+
+def _ensure_bookable(db: Session, trainer_id: str, client_id: str, start: datetime, end: datetime, exclude_id: Optional[str] = None):
+    if _busy_blocks(db, trainer_id, start, end):
+        raise HTTPException(status_code=409, detail="Trainer is not available at this time")
+    for user_filter in (DBAppointment.trainerId == trainer_id, DBAppointment.clientId == client_id):
+        if _busy_appointments(db, user_filter, start, end, exclude_id):
+            raise HTTPException(status_code=409, detail="Appointment overlaps an existing booking")
+
+
+def _get_appointment_or_404(db: Session, appointment_id: str) -> DBAppointment:
+    row = db.query(DBAppointment).filter(DBAppointment.id == appointment_id).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Appointment not found")
+    return row
+
+
+def _create_blocked_time(db: Session, blocked: DBBlockedTime) -> BlockedTime:
+    _lock_schedules(db, blocked.trainerId)
+    if _busy_appointments(db, DBAppointment.trainerId == blocked.trainerId, blocked.startTime, blocked.endTime):
+        raise HTTPException(status_code=409, detail="Blocked time overlaps a scheduled appointment")
+    db.add(blocked)
+    db.commit()
+    return _to_blocked_time(blocked)
 
 
 @router.get("/appointments", response_model=List[Appointment])
-async def list_appointments():
-    return APPOINTMENTS
+def list_appointments(db: read_db_dependency):
+    return [_to_appointment(a) for a in db.query(DBAppointment).order_by(DBAppointment.startTime).all()]
 
 
 @router.get("/appointments/user/{user_id}", response_model=List[Appointment])
-async def get_user_appointments(user_id: str):
-    return [a for a in APPOINTMENTS if a.clientId == user_id or a.trainerId == user_id]
+def get_user_appointments(user_id: str, db: read_db_dependency):
+    rows = (
+        db.query(DBAppointment)
+        .filter(or_(DBAppointment.trainerId == user_id, DBAppointment.clientId == user_id))
+        .order_by(DBAppointment.startTime)
+        .all()
+    )
+    return [_to_appointment(a) for a in rows]
+
+
+def _appointments_starting_between(db: Session, start: datetime, end: datetime, user_id: Optional[str] = None):
+    query = db.query(DBAppointment).filter(DBAppointment.startTime >= start, DBAppointment.startTime < end)
+    if user_id is not None:
+        query = query.filter(or_(DBAppointment.trainerId == user_id, DBAppointment.clientId == user_id))
+    return [_to_appointment(a) for a in query.order_by(DBAppointment.startTime).all()]
+
 
+@router.get("/appointments/by-date", response_model=List[Appointment])
+def get_appointments_by_date(date: str, db: read_db_dependency):
+    start = _parse_day(date)
+    return _appointments_starting_between(db, start, start + timedelta(days=1))
 
-@router.get("/appointments/by-date")
-async def get_appointments_by_date(date: str):
-    target = datetime.fromisoformat(date)
-    start = target.replace(hour=0, minute=0, second=0, microsecond=0)
-    end = start + timedelta(days=1)
-    results = []
-    for a in APPOINTMENTS:
-        st = datetime.fromisoformat(a.startTime)
-        if start <= st < end:
-            results.append(a)
-    return results
+
+@router.get("/appointments/range", response_model=List[Appointment])
+def get_appointments_in_range(
+    db: read_db_dependency,
+    from_: str = Query(alias="from"),
+    to: str = Query(),
+    userId: Optional[str] = None,
+):
+    start, end = _parse_range(from_, to)
+    return _appointments_starting_between(db, start, end, userId)
 
 
 @router.post("/appointments", response_model=Appointment, status_code=status.HTTP_201_CREATED)
-async def create_appointment(payload: CreateAppointmentRequest):
-    appointment = Appointment(
-        id=f"apt-{int(datetime.utcnow().timestamp()*1000)}",
+def create_appointment(payload: CreateAppointmentRequest, db: db_dependency):
+    start, end = _parse_span(payload.startTime, payload.endTime)
+    _lock_schedules(db, payload.trainerId, payload.clientId)
+    _ensure_bookable(db, payload.trainerId, payload.clientId, start, end)
+    appointment = DBAppointment(
+        id=new_id("apt"),
         trainerId=payload.trainerId,
         clientId=payload.clientId,
         title=payload.title,
         description=payload.description,
-        startTime=payload.startTime,
-        endTime=payload.endTime,
+        startTime=start,
+        endTime=end,
         status="scheduled",
         location=payload.location,
         notes=payload.notes,
     )
-    APPOINTMENTS.append(appointment)
-    return appointment
+    db.add(appointment)
+    db.commit()
+    return _to_appointment(appointment)
 
 
 @router.put("/appointments/{appointment_id}", response_model=Appointment)
-async def update_appointment(appointment_id: str, payload: UpdateAppointmentRequest):
-    for idx, a in enumerate(APPOINTMENTS):
-        if a.id == appointment_id:
-            updated = a.model_copy(update={
-                **({"title": payload.title} if payload.title is not None else {}),
-                **({"description": payload.description} if payload.description is not None else {}),
-                **({"startTime": payload.startTime} if payload.startTime is not None else {}),
-                **({"endTime": payload.endTime} if payload.endTime is not None else {}),
-                **({"status": payload.status} if payload.status is not None else {}),
-                **({"location": payload.location} if payload.location is not None else {}),
-                **({"notes": payload.notes} if payload.notes is not None else {}),
-            })
-            APPOINTMENTS[idx] = updated
-            return updated
-    raise HTTPException(status_code=404, detail="Appointment not found")
+def update_appointment(appointment_id: str, payload: UpdateAppointmentRequest, db: db_dependency):
+    a = _get_appointment_or_404(db, appointment_id)
+    start = parse_param(payload.startTime, "startTime") if payload.startTime is not None else a.startTime
+    end = parse_param(payload.endTime, "endTime") if payload.endTime is not None else a.endTime
+    if end <= start:
+        raise HTTPException(status_code=400, detail="End time must be after start time")
+    new_status = payload.status if payload.status is not None else a.status
+    if new_status != "cancelled":
+        _lock_schedules(db, a.trainerId, a.clientId)
+        _ensure_bookable(db, a.trainerId, a.clientId, start, end, exclude_id=a.id)
+    for field in ("title", "description", "location", "notes"):
+        value = getattr(payload, field)
+        if value is not None:
+            setattr(a, field, value)
+    a.startTime = start
+    a.endTime = end
+    a.status = new_status
+    db.commit()
+    return _to_appointment(a)
 
 
 @router.post("/appointments/{appointment_id}/cancel")
-async def cancel_appointment(appointment_id: str):
-    for idx, a in enumerate(APPOINTMENTS):
-        if a.id == appointment_id:
-            APPOINTMENTS[idx] = a.model_copy(update={"status": "cancelled"})
-            return {"message": "Appointment cancelled"}
-    raise HTTPException(status_code=404, detail="Appointment not found")
+def cancel_appointment(appointment_id: str, db: db_dependency):
+    a = _get_appointment_or_404(db, appointment_id)
+    a.status = "cancelled"
+    db.commit()
+    return {"message": "Appointment cancelled"}
 
 
 @router.delete("/appointments/{appointment_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_appointment(appointment_id: str):
-    global APPOINTMENTS
-    before = len(APPOINTMENTS)
-    APPOINTMENTS = [a for a in APPOINTMENTS if a.id != appointment_id]
-    if len(APPOINTMENTS) == before:
+def delete_appointment(appointment_id: str, db: db_dependency):
+    if db.query(DBAppointment).filter(DBAppointment.id == appointment_id).delete() == 0:
         raise HTTPException(status_code=404, detail="Appointment not found")
+    db.commit()
     return
 
 
 @router.get("/availability/blocked-times", response_model=List[BlockedTime])
-async def list_blocked_times():
-    return BLOCKED_TIMES
+def list_blocked_times(db: read_db_dependency):
+    return [_to_blocked_time(b) for b in db.query(DBBlockedTime).order_by(DBBlockedTime.startTime).all()]
 
 
 @router.get("/availability/blocked-times/by-date", response_model=List[BlockedTime])
-async def get_blocked_times_by_date(date: str):
-    target = datetime.fromisoformat(date).replace(hour=0, minute=0, second=0, microsecond=0)
-    next_day = target + timedelta(days=1)
-    results: List[BlockedTime] = []
-    for b in BLOCKED_TIMES:
-        st = datetime.fromisoformat(b.startTime)
-        if target <= st < next_day:
-            results.append(b)
-    return results
+def get_blocked_times_by_date(date: str, db: read_db_dependency):
+    target = _parse_day(date)
+    rows = (
+        db.query(DBBlockedTime)
+        .filter(DBBlockedTime.startTime >= target, DBBlockedTime.startTime < target + timedelta(days=1))
+        .order_by(DBBlockedTime.startTime)
+        .all()
+    )
+    return [_to_blocked_time(b) for b in rows]
 
 
 @router.post("/availability/blocked-times", response_model=BlockedTime, status_code=status.HTTP_201_CREATED)
-async def create_blocked_time(payload: CreateBlockedTimeRequest):
-    blocked = BlockedTime(
-        id=f"block-{int(datetime.utcnow().timestamp()*1000)}",
+def create_blocked_time(payload: CreateBlockedTimeRequest, db: db_dependency):
+    start, end = _parse_span(payload.startTime, payload.endTime)
+    if payload.isFullDay:
+        start, end = full_day_span(start, end)
+    blocked = DBBlockedTime(
+        id=new_id("block"),
         trainerId=payload.trainerId,
-        startTime=payload.startTime,
-        endTime=payload.endTime,
+        startTime=start,
+        endTime=end,
         isFullDay=payload.isFullDay,
         reason=payload.reason,
     )
-    BLOCKED_TIMES.append(blocked)
-    return blocked
+    return _create_blocked_time(db, blocked)
 
 
 @router.delete("/availability/blocked-times/{blocked_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_blocked_time(blocked_id: str):
-    global BLOCKED_TIMES
-    before = len(BLOCKED_TIMES)
-    BLOCKED_TIMES = [b for b in BLOCKED_TIMES if b.id != blocked_id]
-    if len(BLOCKED_TIMES) == before:
+def delete_blocked_time(blocked_id: str, db: db_dependency):
+    if db.query(DBBlockedTime).filter(DBBlockedTime.id == blocked_id).delete() == 0:
         raise HTTPException(status_code=404, detail="Blocked time not found")
+    db.commit()
     return
 
 
-@router.post("/availability/block-full-day")
-async def block_full_day(trainerId: str, date: str, reason: Optional[str] = None):
-    start = datetime.fromisoformat(date).replace(hour=0, minute=0, second=0, microsecond=0)
-    end = start + timedelta(days=1)
-    blocked = BlockedTime(
-        id=f"block-day-{int(datetime.utcnow().timestamp()*1000)}",
+@router.post("/availability/block-full-day", response_model=BlockedTime)
+def block_full_day(trainerId: str, date: str, db: db_dependency, reason: Optional[str] = None):
+    start = _parse_day(date)
+    blocked = DBBlockedTime(
+        id=new_id("block-day"),
         trainerId=trainerId,
-        startTime=start.isoformat(),
-        endTime=end.isoformat(),
+        startTime=start,
+        endTime=start + timedelta(days=1),
         isFullDay=True,
         reason=reason or "Not available",
     )
-    BLOCKED_TIMES.append(blocked)
-    return blocked
+    return _create_blocked_time(db, blocked)
 
 
 @router.delete("/availability/unblock-full-day")
-async def unblock_full_day(trainerId: str, date: str):
-    target = datetime.fromisoformat(date).replace(hour=0, minute=0, second=0, microsecond=0)
-    global BLOCKED_TIMES
-    before = len(BLOCKED_TIMES)
-    BLOCKED_TIMES = [
-        b for b in BLOCKED_TIMES
-        if not (b.trainerId == trainerId and b.isFullDay and datetime.fromisoformat(b.startTime) == target)
-    ]
-    removed = before - len(BLOCKED_TIMES)
+def unblock_full_day(trainerId: str, date: str, db: db_dependency):
+    target = _parse_day(date)
+    removed = db.query(DBBlockedTime).filter(
+        DBBlockedTime.trainerId == trainerId,
+        DBBlockedTime.startTime == target,
+        DBBlockedTime.isFullDay.is_(True),
+    ).delete()
     if removed == 0:
         raise HTTPException(status_code=404, detail="Full-day block not found")
+    db.commit()
     return {"message": "Full-day block removed"}
 
 
+@router.get("/availability/{trainer_id}", response_model=Availability)
+def get_availability(
+    trainer_id: str,
+    db: read_db_dependency,
+    from_: str = Query(alias="from"),
+    to: str = Query(),
+    slot: int = Query(default=60, gt=0, le=24 * 60),
+):
+    start, end = _parse_range(from_, to)
+    if end - start > MAX_AVAILABILITY_WINDOW:
+        raise HTTPException(status_code=400, detail="Availability window is limited to 62 days")
+    busy = merge_busy(
+        _busy_appointments(db, DBAppointment.trainerId == trainer_id, start, end),
+        _busy_blocks(db, trainer_id, start, end),
+    )
+    windows = free_windows(start, end, busy)
+    slots = split_slots(windows, timedelta(minutes=slot))
+    return Availability(
+        trainerId=trainer_id,
+        slotMinutes=slot,
+        freeWindows=[AvailabilitySlot(startTime=to_iso(s), endTime=to_iso(e)) for s, e in windows],
+        slots=[AvailabilitySlot(startTime=to_iso(s), endTime=to_iso(e)) for s, e in slots],
+    )
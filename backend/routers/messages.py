@@ -1,7 +1,20 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, WebSocket, status
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
+from typing_extensions import Annotated
 from datetime import datetime
+from sqlalchemy import delete, insert, tuple_, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from models.fitness import Message as DBMessage, UnreadCounter
+from settings.database import get_db, get_read_db
+from services.conversations import conversation_key
+from services.ids import new_id
+from services import uploads
+from services.images import thumbnail_url
+from services.realtime import hub
+from services.timeutils import to_iso
+from services.upsert import insert_or_add
 
 
 router = APIRouter(
@@ -9,6 +22,9 @@ router = APIRouter(
     tags=["messages"],
 )
 
+db_dependency = Annotated[Session, Depends(get_db)]
+read_db_dependency = Annotated[Session, Depends(get_read_db)]
+
 
 class Attachment(BaseModel):
     id: str
@@ -36,6 +52,15 @@ class SendMessageRequest(BaseModel):
     attachments: Optional[List[Attachment]] = None
 
 
+class MarkReadRequest(BaseModel):
+    # Either explicit ids, or every message userId received from otherUserId
+    # up to and including the upTo message (all of them when upTo is omitted)
+    ids: Optional[List[str]] = None
+    userId: Optional[str] = None
+    otherUserId: Optional[str] = None
+    upTo: Optional[str] = None
+
+
 class BroadcastRequest(BaseModel):
     senderId: str
     receiverIds: List[str]
@@ -43,78 +68,266 @@ class BroadcastRequest(BaseModel):
     attachments: Optional[List[Attachment]] = None
 
 
-MESSAGES: List[Message] = []
+def _to_message(row: DBMessage) -> Message:
+    return Message(
+        id=row.id,
+        senderId=row.senderId,
+        receiverId=row.receiverId,
+        content=row.content,
+        timestamp=to_iso(row.timestamp),
+        read=bool(row.read),
+        attachments=row.attachments,
+    )
+
+
+def _dump_attachments(attachments: Optional[List[Attachment]]):
+    if attachments is None:
+        return None
+    dumped = []
+    for attachment in attachments:
+        data = attachment.model_dump()
+        if data["type"] == "image" and data["thumbnailUrl"] is None:
+            # Images uploaded through our endpoints already have a thumbnail
+            data["thumbnailUrl"] = thumbnail_url(data["url"])
+        dumped.append(data)
+    return dumped
+
+
+def _attachment_urls(attachments: Optional[List[dict]]) -> List[str]:
+    # Stored uploads are shared by content, so attachments hold references
+    # like progress photos do (uploads.retain ignores other URLs)
+    return [attachment["url"] for attachment in attachments or []]
+
+
+def _bump_unread(db: Session, receiver_id: str, delta: int):
+    if delta > 0:
+        _bump_unread_many(db, [receiver_id], delta)
+        return
+    # A receiver without a counter has nothing to take away from
+    db.query(UnreadCounter).filter(UnreadCounter.receiverId == receiver_id).update(
+        {UnreadCounter.count: UnreadCounter.count + delta}, synchronize_session=False
+    )
+
+
+def _bump_unread_many(db: Session, receiver_ids: List[str], delta: int = 1):
+    rows = [{"receiverId": r, "count": delta} for r in receiver_ids]
+    insert_or_add(db, UnreadCounter, rows, keys=["receiverId"])
+
+
+def _mark_read(db: Session, query) -> List[tuple]:
+    candidates = [m.id for m in query.filter(DBMessage.read.is_(False)).with_entities(DBMessage.id)]
+    if not candidates:
+        return []
+    # Only rows that are still unread flip, so a concurrent call can't count
+    # the same message twice; counters drop by what this call flipped
+    flipped = db.execute(
+        update(DBMessage)
+        .where(DBMessage.id.in_(candidates), DBMessage.read.is_(False))
+        .values(read=True)
+        .returning(DBMessage.id, DBMessage.senderId, DBMessage.receiverId)
+        .execution_options(synchronize_session=False)
+    ).all()
+    per_receiver: Dict[str, int] = {}
+    for m in flipped:
+        per_receiver[m.receiverId] = per_receiver.get(m.receiverId, 0) + 1
+    for receiver_id, count in per_receiver.items():
+        _bump_unread(db, receiver_id, -count)
+    return flipped
+
+
+async def _publish_read_receipts(flipped: List[tuple]):
+    # One receipt per (sender, reader) pair listing the ids that were read
+    receipts: Dict[tuple, List[str]] = {}
+    for m in flipped:
+        receipts.setdefault((m.senderId, m.receiverId), []).append(m.id)
+    for (sender_id, reader_id), ids in receipts.items():
+        await hub.publish([sender_id, reader_id], {"type": "read", "readerId": reader_id, "ids": ids})
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def _page(db: Session, query, before: Optional[str], after: Optional[str], limit: int) -> List[Message]:
+    """Keyset page over (timestamp, id), always returned oldest first.
+
+    Without a cursor the newest ``limit`` messages are returned; ``before``
+    walks back into history and ``after`` fetches what arrived since.
+    """
+    if before is not None and after is not None:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'after', not both")
+    position = tuple_(DBMessage.timestamp, DBMessage.id)
+    cursor_id = before if before is not None else after
+    if cursor_id is not None:
+        cursor = db.query(DBMessage.timestamp, DBMessage.id).filter(DBMessage.id == cursor_id).first()
+        if cursor is None:
+            raise HTTPException(status_code=404, detail="Cursor message not found")
+        cursor_position = tuple_(cursor.timestamp, cursor.id)
+    if after is not None:
+        rows = query.filter(position > cursor_position).order_by(DBMessage.timestamp, DBMessage.id).limit(limit).all()
+    else:
+        if before is not None:
+            query = query.filter(position < cursor_position)
+        rows = query.order_by(DBMessage.timestamp.desc(), DBMessage.id.desc()).limit(limit).all()
+        rows.reverse()
+    return [_to_message(m) for m in rows]
 
 
 @router.get("/", response_model=List[Message])
-async def list_messages():
-    return MESSAGES
+def list_messages(
+    db: read_db_dependency,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE),
+):
+    return _page(db, db.query(DBMessage), before, after, limit)
 
 
-@router.get("/conversation")
-async def get_conversation(userId: str, otherUserId: str):
-    results = [
-        m for m in MESSAGES
-        if (m.senderId == userId and m.receiverId == otherUserId) or (m.senderId == otherUserId and m.receiverId == userId)
-    ]
-    results.sort(key=lambda m: m.timestamp)
-    return results
+@router.get("/conversation", response_model=List[Message])
+def get_conversation(
+    userId: str,
+    otherUserId: str,
+    db: read_db_dependency,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE),
+):
+    query = db.query(DBMessage).filter(DBMessage.conversationKey == conversation_key(userId, otherUserId))
+    return _page(db, query, before, after, limit)
 
 
-@router.post("/send", response_model=Message, status_code=status.HTTP_201_CREATED)
-async def send_message(payload: SendMessageRequest):
-    message = Message(
-        id=f"msg-{int(datetime.utcnow().timestamp()*1000)}",
+def _send(db: Session, payload: SendMessageRequest) -> Message:
+    message = DBMessage(
+        id=new_id("msg"),
         senderId=payload.senderId,
         receiverId=payload.receiverId,
+        conversationKey=conversation_key(payload.senderId, payload.receiverId),
         content=payload.content,
-        timestamp=datetime.utcnow().isoformat(),
+        timestamp=datetime.utcnow(),
         read=False,
-        attachments=payload.attachments,
+        attachments=_dump_attachments(payload.attachments),
     )
-    MESSAGES.append(message)
-    return message
+    db.add(message)
+    uploads.retain(db, _attachment_urls(message.attachments))
+    _bump_unread(db, payload.receiverId, 1)
+    db.commit()
+    return _to_message(message)
+
+
+@router.post("/send", response_model=Message, status_code=status.HTTP_201_CREATED)
+async def send_message(payload: SendMessageRequest, db: db_dependency):
+    # The session is synchronous, so its queries run off the event loop
+    result = await run_in_threadpool(_send, db, payload)
+    await hub.publish([result.senderId, result.receiverId], {"type": "message", "message": result.model_dump()})
+    return result
+
+
+def _mark_many(db: Session, payload: MarkReadRequest) -> List[tuple]:
+    if payload.ids is not None:
+        query = db.query(DBMessage).filter(DBMessage.id.in_(payload.ids))
+    elif payload.userId is not None and payload.otherUserId is not None:
+        query = db.query(DBMessage).filter(
+            DBMessage.conversationKey == conversation_key(payload.userId, payload.otherUserId),
+            DBMessage.receiverId == payload.userId,
+        )
+        if payload.upTo is not None:
+            cursor = db.query(DBMessage.timestamp, DBMessage.id).filter(DBMessage.id == payload.upTo).first()
+            if cursor is None:
+                raise HTTPException(status_code=404, detail="Cursor message not found")
+            query = query.filter(tuple_(DBMessage.timestamp, DBMessage.id) <= tuple_(cursor.timestamp, cursor.id))
+    else:
+        raise HTTPException(status_code=400, detail="Provide either 'ids' or 'userId' and 'otherUserId'")
+    flipped = _mark_read(db, query)
+    db.commit()
+    return flipped
+
+
+@router.post("/read")
+async def mark_many_as_read(payload: MarkReadRequest, db: db_dependency):
+    flipped = await run_in_threadpool(_mark_many, db, payload)
+    await _publish_read_receipts(flipped)
+    return {"updated": len(flipped)}
+
+
+def _mark_one(db: Session, message_id: str) -> List[tuple]:
+    query = db.query(DBMessage).filter(DBMessage.id == message_id)
+    if query.first() is None:
+        raise HTTPException(status_code=404, detail="Message not found")
+    flipped = _mark_read(db, query)
+    db.commit()
+    return flipped
 
 
 @router.post("/{message_id}/read")
-async def mark_as_read(message_id: str):
-    for idx, m in enumerate(MESSAGES):
-        if m.id == message_id:
-            MESSAGES[idx] = m.model_copy(update={"read": True})
-            return {"message": "Marked as read"}
-    raise HTTPException(status_code=404, detail="Message not found")
+async def mark_as_read(message_id: str, db: db_dependency):
+    flipped = await run_in_threadpool(_mark_one, db, message_id)
+    await _publish_read_receipts(flipped)
+    return {"message": "Marked as read"}
 
 
 @router.delete("/{message_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_message(message_id: str):
-    global MESSAGES
-    before = len(MESSAGES)
-    MESSAGES = [m for m in MESSAGES if m.id != message_id]
-    if len(MESSAGES) == before:
+def delete_message(message_id: str, db: db_dependency):
+    # The read flag comes back from the DELETE itself, so a concurrent
+    # mark-read can't also decrement the counter for this message
+    message = db.execute(
+        delete(DBMessage)
+        .where(DBMessage.id == message_id)
+        .returning(DBMessage.read, DBMessage.receiverId, DBMessage.attachments)
+    ).first()
+    if message is None:
         raise HTTPException(status_code=404, detail="Message not found")
+    if not message.read:
+        _bump_unread(db, message.receiverId, -1)
+    orphaned = uploads.release(db, _attachment_urls(message.attachments))
+    db.commit()
+    uploads.collect(orphaned)
     return
 
 
-@router.post("/broadcast")
-async def send_broadcast(payload: BroadcastRequest):
-    created = []
-    for rid in payload.receiverIds:
-        m = Message(
-            id=f"msg-{int(datetime.utcnow().timestamp()*1000)}-{rid}",
-            senderId=payload.senderId,
-            receiverId=rid,
-            content=payload.content,
-            timestamp=datetime.utcnow().isoformat(),
-            read=False,
-            attachments=payload.attachments,
-        )
-        MESSAGES.append(m)
-        created.append(m)
-    return created
+async def _fan_out(results: List[Message]):
+    for result in results:
+        await hub.publish([result.receiverId], {"type": "message", "message": result.model_dump()})
+
+
+@router.post("/broadcast", response_model=List[Message])
+def send_broadcast(payload: BroadcastRequest, db: db_dependency, background_tasks: BackgroundTasks):
+    # One timestamp and one serialized attachment list shared by every row,
+    # written with a single executemany insert in one transaction
+    receiver_ids = list(dict.fromkeys(payload.receiverIds))
+    now = datetime.utcnow()
+    attachments = _dump_attachments(payload.attachments)
+    rows = [
+        {
+            "id": new_id("msg"),
+            "senderId": payload.senderId,
+            "receiverId": rid,
+            "conversationKey": conversation_key(payload.senderId, rid),
+            "content": payload.content,
+            "timestamp": now,
+            "read": False,
+            "attachments": attachments,
+        }
+        for rid in receiver_ids
+    ]
+    if rows:
+        db.execute(insert(DBMessage), rows)
+        # One reference per message row
+        uploads.retain(db, _attachment_urls(attachments) * len(rows))
+        _bump_unread_many(db, receiver_ids)
+        db.commit()
+    timestamp = to_iso(now)
+    results = [Message(**{**row, "timestamp": timestamp}) for row in rows]
+    background_tasks.add_task(_fan_out, results)
+    return results
 
 
 @router.get("/unread-count/{user_id}")
-async def get_unread_count(user_id: str):
-    return {"unread": len([m for m in MESSAGES if m.receiverId == user_id and not m.read])}
+def get_unread_count(user_id: str, db: read_db_dependency):
+    counter = db.query(UnreadCounter.count).filter(UnreadCounter.receiverId == user_id).first()
+    return {"unread": max(counter.count, 0) if counter is not None else 0}
 
 
+@router.websocket("/ws")
+async def messages_ws(websocket: WebSocket, userId: str):
+    # Pushes "message" and "read" events for userId until the socket closes
+    await hub.serve(websocket, userId)
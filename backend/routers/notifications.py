@@ -3,7 +3,7 @@ from typing import Annotated
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 from models.models import Blogs
-from settings.database import engine, SessionLocal
+from settings.database import get_db
 from .auth import get_current_user
 
 router = APIRouter(
@@ -11,14 +11,6 @@ router = APIRouter(
     tags=["notifications"]
 )
 
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 db_dependency = Annotated[Session, Depends(get_db)]
 user_dependencty = Annotated[dict, Depends(get_current_user)]
 
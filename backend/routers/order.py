@@ -2,24 +2,21 @@ from fastapi import APIRouter, Depends, HTTPException, Path, status
 from typing import Annotated
 from datetime import datetime
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from models.models import Products
-from settings.database import engine, SessionLocal
+from settings.database import get_async_db, get_async_read_db
 from .auth import get_current_user
+# Orders live in the products table, so writes here drop cached product reads
+from .products import invalidate_product
 
 router = APIRouter(
     prefix="/orders",
     tags=["orders"]
 )
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
+read_db_dependency = Annotated[AsyncSession, Depends(get_async_read_db)]
 user_dependencty = Annotated[dict, Depends(get_current_user)]
 
 class OrderRequest(BaseModel):
@@ -42,16 +39,17 @@ async def create_order(db: db_dependency, order_request: OrderRequest, user: use
         raise HTTPException(status_code=401, detail="Authentication failed")
     order_model = Products(**order_request.dict())
     db.add(order_model)
-    db.commit()
+    await db.commit()
+    invalidate_product()
     return {"message": "Order created successfully"}
 
 @router.get("", status_code=status.HTTP_200_OK)
-async def get_orders(db: db_dependency):
-    return db.query(Products).all()
+async def get_orders(db: read_db_dependency):
+    return (await db.scalars(select(Products))).all()
 
 @router.get("/{order_id}", status_code=status.HTTP_200_OK)
-async def get_order(db: db_dependency, order_id: int = Path(gt=0)):
-    order_model = db.query(Products).filter(Products.id == order_id).first()
+async def get_order(db: read_db_dependency, order_id: int = Path(gt=0)):
+    order_model = await db.get(Products, order_id)
     if order_model is not None:
         return order_model
     raise HTTPException(status_code=404, detail="Order not found")
@@ -60,20 +58,22 @@ async def get_order(db: db_dependency, order_id: int = Path(gt=0)):
 async def update_order(db: db_dependency, order_request: OrderRequest, order_id: int = Path(gt=0), user: user_dependencty = None):
     if user is None:
         raise HTTPException(status_code=401, detail="Authentication failed")
-    order_model = db.query(Products).filter(Products.id == order_id).first()
+    order_model = await db.get(Products, order_id)
     if order_model is None:
         raise HTTPException(status_code=404, detail="Order not found")
     order_model.update(order_request.dict())
-    db.commit()
+    await db.commit()
+    invalidate_product(order_id)
     return {"message": "Order updated successfully"}
 
 @router.delete("/{order_id}", status_code=status.HTTP_200_OK, dependencies=[Depends(get_current_user)])
 async def delete_order(db: db_dependency, order_id: int = Path(gt=0), user: user_dependencty = None):
     if user is None:
         raise HTTPException(status_code=401, detail="Authentication failed")
-    order_model = db.query(Products).filter(Products.id == order_id).first()
+    order_model = await db.get(Products, order_id)
     if order_model is None:
         raise HTTPException(status_code=404, detail="Order not found")
-    db.query(Products).filter(Products.id == order_id).delete()
-    db.commit()
+    await db.execute(delete(Products).where(Products.id == order_id))
+    await db.commit()
+    invalidate_product(order_id)
     return {"message": "Order deleted successfully"}
\ No newline at end of file
@@ -1,26 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, Path, status
-from typing import Annotated
+from fastapi import APIRouter, Depends, HTTPException, Path, Request, status
+from typing import Annotated, Optional
 from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from models.models import Products
-from settings.database import engine, SessionLocal
+from settings.database import get_async_db, get_async_read_db
 from .auth import get_current_user
+from services.response_cache import ResponseCache
 
 router = APIRouter(
     prefix="/products",
     tags=["products"]
 )
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[AsyncSession, Depends(get_async_db)]
+read_db_dependency = Annotated[AsyncSession, Depends(get_async_read_db)]
 user_dependencty = Annotated[dict, Depends(get_current_user)]
 
+# Public reads, served from memory until a write here invalidates them; the
+# TTL bounds how stale other workers' copies can get
+RESPONSE_CACHE = ResponseCache(max_entries=1000, ttl=60)
+
+def invalidate_product(product_id: Optional[int] = None):
+    RESPONSE_CACHE.invalidate_route("all_products")
+    if product_id is not None:
+        RESPONSE_CACHE.invalidate("single_product", product_id)
+
 class ProductRequest(BaseModel):
     name: str = Field(min_length=3)
     description: str = Field(min_length=3)
@@ -28,14 +33,22 @@ class ProductRequest(BaseModel):
     stock: int = Field(gt=0)
 
 @router.get("", status_code=status.HTTP_200_OK)
-async def all_products(db: db_dependency):
-    return db.query(Products).all()
+async def all_products(db: read_db_dependency, request: Request):
+    cache_key = RESPONSE_CACHE.key("all_products")
+    cached = RESPONSE_CACHE.get(cache_key)
+    if cached is None:
+        cached = RESPONSE_CACHE.put(cache_key, (await db.scalars(select(Products))).all())
+    return cached.respond(request)
 
 @router.get("/{product_id}", status_code=status.HTTP_200_OK)
-async def single_product(db: db_dependency, product_id: int = Path(gt=0)):
-    product_model = db.query(Products).filter(Products.id == product_id).first()
+async def single_product(db: read_db_dependency, request: Request, product_id: int = Path(gt=0)):
+    cache_key = RESPONSE_CACHE.key("single_product", product_id)
+    cached = RESPONSE_CACHE.get(cache_key)
+    if cached is not None:
+        return cached.respond(request)
+    product_model = await db.get(Products, product_id)
     if product_model is not None:
-        return product_model
+        return RESPONSE_CACHE.put(cache_key, product_model).respond(request)
     raise HTTPException(status_code=404, detail="Product not found")
 
 @router.post("/new_product", status_code=status.HTTP_201_CREATED)
@@ -44,14 +57,15 @@ async def create_product(db: db_dependency, user: user_dependencty, product_requ
         raise HTTPException(status_code=401, detail="Authentication failed")
     product_model = Products(**product_request.dict(), owner_id=user.get("id"))
     db.add(product_model)
-    db.commit()
+    await db.commit()
+    invalidate_product()
     return product_model
 
 @router.put("/{product_id}", status_code=status.HTTP_200_OK)
 async def update_product(db: db_dependency, user: user_dependencty, product_request: ProductRequest, product_id: int = Path(gt=0)):
     if user is None:
         raise HTTPException(status_code=401, detail="Authentication failed")
-    product_model = db.query(Products).filter(Products.id == product_id).first()
+    product_model = await db.get(Products, product_id)
     if product_model is None:
         raise HTTPException(status_code=404, detail="Product not found")
     if product_model.owner_id != user.get("id"):
@@ -60,18 +74,20 @@ async def update_product(db: db_dependency, user: user_dependencty, product_requ
     product_model.description = product_request.description
     product_model.price = product_request.price
     product_model.stock = product_request.stock
-    db.commit()
+    await db.commit()
+    invalidate_product(product_id)
     return product_model
 
 @router.delete("/{product_id}", status_code=status.HTTP_200_OK)
 async def delete_product(db: db_dependency, user: user_dependencty, product_id: int = Path(gt=0)):
     if user is None:
         raise HTTPException(status_code=401, detail="Authentication failed")
-    product_model = db.query(Products).filter(Products.id == product_id).first()
+    product_model = await db.get(Products, product_id)
     if product_model is None:
         raise HTTPException(status_code=404, detail="Product not found")
     if product_model.owner_id != user.get("id"):
         raise HTTPException(status_code=403, detail="You are not authorized to delete this product")
-    db.query(Products).filter(Products.id == product_id).delete()
-    db.commit()
+    await db.execute(delete(Products).where(Products.id == product_id))
+    await db.commit()
+    invalidate_product(product_id)
     return {"message": "Product deleted successfully"}  
\ No newline at end of file
@@ -1,9 +1,19 @@
-from fastapi import APIRouter, HTTPException, status, File, UploadFile
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, status, File, UploadFile
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
+from typing_extensions import Annotated
 from datetime import datetime
-from pathlib import Path
-import shutil
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from models.fitness import LatestMeasurement, ProgressEntry as DBProgressEntry
+from settings.database import get_db, get_read_db
+from services.ids import new_id
+from services import measurement_series as series
+from services.timeutils import parse_param, to_iso
+from services import uploads
+from services.images import create_variants, existing_variants
 
 
 router = APIRouter(
@@ -11,9 +21,8 @@ router = APIRouter(
     tags=["progress"],
 )
 
-
-UPLOADS_DIR = Path("uploads/progress_photos")
-UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
+db_dependency = Annotated[Session, Depends(get_db)]
+read_db_dependency = Annotated[Session, Depends(get_read_db)]
 
 
 class Measurements(BaseModel):
@@ -34,6 +43,7 @@ class ProgressEntry(BaseModel):
     date: str
     type: str  # 'photo' | 'measurement' | 'note'
     photos: Optional[List[str]] = None
+    photoVariants: Optional[List[Dict[str, str]]] = None  # parallel to photos
     measurements: Optional[Measurements] = None
     notes: Optional[str] = None
 
@@ -50,116 +60,240 @@ class CreateNoteRequest(BaseModel):
 
 class UpdateProgressRequest(BaseModel):
     photos: Optional[List[str]] = None
+    photoVariants: Optional[List[Dict[str, str]]] = None  # parallel to photos
     measurements: Optional[Measurements] = None
     notes: Optional[str] = None
 
 
-ENTRIES: List[ProgressEntry] = []
+def _to_entry(row: DBProgressEntry) -> ProgressEntry:
+    return ProgressEntry(
+        id=row.id,
+        clientId=row.clientId,
+        date=to_iso(row.date),
+        type=row.type,
+        photos=row.photos,
+        photoVariants=row.photoVariants,
+        measurements=row.measurements,
+        notes=row.notes,
+    )
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def _client_entries(db: Session, client_id: str, entry_type: Optional[str] = None):
+    # Newest first; served by the (clientId, date) and (clientId, type, date) indexes
+    query = db.query(DBProgressEntry).filter(DBProgressEntry.clientId == client_id)
+    if entry_type is not None:
+        query = query.filter(DBProgressEntry.type == entry_type)
+    return query.order_by(DBProgressEntry.date.desc(), DBProgressEntry.id.desc())
+
+
+def _refresh_latest_measurement(db: Session, client_id: str):
+    latest = _client_entries(db, client_id, "measurement").first()
+    pointer = db.query(LatestMeasurement).filter(LatestMeasurement.clientId == client_id).first()
+    if latest is None:
+        if pointer is not None:
+            db.delete(pointer)
+        return
+    if pointer is None:
+        pointer = LatestMeasurement(clientId=client_id, entryId=latest.id)
+        db.add(pointer)
+    pointer.entryId = latest.id
+    pointer.date = latest.date
+    pointer.measurements = latest.measurements
+
+
+def _save_entry(db: Session, entry: DBProgressEntry) -> ProgressEntry:
+    db.add(entry)
+    if entry.type == "measurement":
+        db.flush()
+        _refresh_latest_measurement(db, entry.clientId)
+    db.commit()
+    return _to_entry(entry)
+
+
+def _measurement_columns(db: Session, client_ids: List[str]) -> series.MeasurementColumns:
+    rows = (
+        db.query(DBProgressEntry.clientId, DBProgressEntry.date, DBProgressEntry.measurements)
+        .filter(DBProgressEntry.clientId.in_(client_ids), DBProgressEntry.type == "measurement")
+        .order_by(DBProgressEntry.clientId, DBProgressEntry.date)
+        .all()
+    )
+    return series.MeasurementColumns.from_rows(client_ids, rows)
+
+
+@router.get("/series")
+def get_roster_series(db: read_db_dependency, clientIds: List[str] = Query()):
+    # Trend summary for many clients computed in one vectorized pass
+    ids = list(dict.fromkeys(i for value in clientIds for i in value.split(",") if i))
+    if len(ids) > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PAGE_SIZE} clients per request")
+    columns = _measurement_columns(db, ids)
+    result = series.trends(columns)
+    return {client_id: series.trend_table(result, i) for i, client_id in enumerate(ids)}
 
 
 @router.get("/{client_id}", response_model=List[ProgressEntry])
-async def get_entries(client_id: str):
-    results = [e for e in ENTRIES if e.clientId == client_id]
-    results.sort(key=lambda e: e.date, reverse=True)
-    return results
+def get_entries(
+    client_id: str,
+    db: read_db_dependency,
+    from_: Optional[str] = Query(default=None, alias="from"),
+    to: Optional[str] = None,
+    type: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE),
+):
+    # Newest first; pass the last id of a page as the next cursor
+    query = _client_entries(db, client_id, type)
+    if from_ is not None:
+        query = query.filter(DBProgressEntry.date >= parse_param(from_, "from"))
+    if to is not None:
+        query = query.filter(DBProgressEntry.date < parse_param(to, "to"))
+    if cursor is not None:
+        position = db.query(DBProgressEntry.date, DBProgressEntry.id).filter(DBProgressEntry.id == cursor).first()
+        if position is None:
+            raise HTTPException(status_code=404, detail="Cursor entry not found")
+        query = query.filter(
+            tuple_(DBProgressEntry.date, DBProgressEntry.id) < tuple_(position.date, position.id)
+        )
+    return [_to_entry(e) for e in query.limit(limit).all()]
 
 
 @router.post("/measurement", response_model=ProgressEntry, status_code=status.HTTP_201_CREATED)
-async def add_measurement(payload: CreateMeasurementRequest):
-    entry = ProgressEntry(
-        id=f"prog-{int(datetime.utcnow().timestamp()*1000)}",
+def add_measurement(payload: CreateMeasurementRequest, db: db_dependency):
+    entry = DBProgressEntry(
+        id=new_id("prog"),
         clientId=payload.clientId,
-        date=datetime.utcnow().isoformat(),
+        date=datetime.utcnow(),
         type="measurement",
-        measurements=payload.measurements,
+        measurements=payload.measurements.model_dump(),
     )
-    ENTRIES.append(entry)
-    return entry
+    return _save_entry(db, entry)
+
+
+def _save_photo_entry(db: Session, entry: DBProgressEntry) -> ProgressEntry:
+    uploads.retain(db, entry.photos)
+    return _save_entry(db, entry)
 
 
 @router.post("/{client_id}/photos", response_model=ProgressEntry, status_code=status.HTTP_201_CREATED)
-async def add_photos(client_id: str, files: List[UploadFile] = File(...)):
+async def add_photos(client_id: str, db: db_dependency, files: List[UploadFile] = File(...)):
     saved_urls: List[str] = []
-    for file in files:
-        if file.content_type not in ["image/jpeg", "image/png", "image/gif"]:
-            raise HTTPException(status_code=400, detail="Invalid file type. Only JPEG, PNG, and GIF are allowed.")
-        ext = file.filename.split(".")[-1]
-        filename = f"{client_id}_{int(datetime.utcnow().timestamp()*1000)}.{ext}"
-        file_path = UPLOADS_DIR / filename
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        saved_urls.append(f"/uploads/progress_photos/{filename}")
-
-    entry = ProgressEntry(
-        id=f"prog-{int(datetime.utcnow().timestamp()*1000)}",
+    try:
+        for file in files:
+            saved_urls.append(await uploads.save_image(file))
+        # Resize all photos of the entry in parallel on the image pool
+        variants = await asyncio.gather(
+            *(create_variants(uploads.path_for(url), url) for url in saved_urls),
+            return_exceptions=True,
+        )
+        for result in variants:
+            if isinstance(result, BaseException):
+                raise result
+    except HTTPException:
+        # One bad file rejects the whole entry; don't leave the others behind
+        await run_in_threadpool(uploads.discard_unreferenced, db, saved_urls)
+        raise
+
+    entry = DBProgressEntry(
+        id=new_id("prog"),
         clientId=client_id,
-        date=datetime.utcnow().isoformat(),
+        date=datetime.utcnow(),
         type="photo",
         photos=saved_urls,
+        photoVariants=list(variants),
     )
-    ENTRIES.append(entry)
-    return entry
+    # The session is synchronous, so its queries run off the event loop
+    return await run_in_threadpool(_save_photo_entry, db, entry)
 
 
 @router.post("/note", response_model=ProgressEntry, status_code=status.HTTP_201_CREATED)
-async def add_note(payload: CreateNoteRequest):
-    entry = ProgressEntry(
-        id=f"prog-{int(datetime.utcnow().timestamp()*1000)}",
+def add_note(payload: CreateNoteRequest, db: db_dependency):
+    entry = DBProgressEntry(
+        id=new_id("prog"),
         clientId=payload.clientId,
-        date=datetime.utcnow().isoformat(),
+        date=datetime.utcnow(),
         type="note",
         notes=payload.note,
     )
-    ENTRIES.append(entry)
-    return entry
+    return _save_entry(db, entry)
 
 
 @router.patch("/{entry_id}", response_model=ProgressEntry)
-async def update_entry(entry_id: str, payload: UpdateProgressRequest):
-    for idx, e in enumerate(ENTRIES):
-        if e.id == entry_id:
-            updated = e.model_copy(update={
-                **({"photos": payload.photos} if payload.photos is not None else {}),
-                **({"measurements": payload.measurements} if payload.measurements is not None else {}),
-                **({"notes": payload.notes} if payload.notes is not None else {}),
-            })
-            ENTRIES[idx] = updated
-            return updated
-    raise HTTPException(status_code=404, detail="Progress entry not found")
+def update_entry(entry_id: str, payload: UpdateProgressRequest, db: db_dependency):
+    e = db.query(DBProgressEntry).filter(DBProgressEntry.id == entry_id).first()
+    if e is None:
+        raise HTTPException(status_code=404, detail="Progress entry not found")
+    orphaned: List[str] = []
+    if payload.photos is not None:
+        uploads.retain(db, payload.photos)
+        orphaned = uploads.release(db, e.photos or [])
+        e.photos = payload.photos
+        e.photoVariants = [existing_variants(url) or {} for url in payload.photos]
+    if payload.measurements is not None:
+        e.measurements = payload.measurements.model_dump()
+    if payload.notes is not None:
+        e.notes = payload.notes
+    if e.type == "measurement":
+        db.flush()
+        _refresh_latest_measurement(db, e.clientId)
+    db.commit()
+    uploads.collect(orphaned)
+    return _to_entry(e)
 
 
 @router.delete("/{entry_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_entry(entry_id: str):
-    global ENTRIES
-    before = len(ENTRIES)
-    ENTRIES = [e for e in ENTRIES if e.id != entry_id]
-    if len(ENTRIES) == before:
+def delete_entry(entry_id: str, db: db_dependency):
+    e = db.query(DBProgressEntry).filter(DBProgressEntry.id == entry_id).first()
+    if e is None:
         raise HTTPException(status_code=404, detail="Progress entry not found")
+    db.delete(e)
+    orphaned = uploads.release(db, e.photos or [])
+    if e.type == "measurement":
+        db.flush()
+        _refresh_latest_measurement(db, e.clientId)
+    db.commit()
+    uploads.collect(orphaned)
     return
 
 
 @router.get("/{client_id}/latest-measurement", response_model=Optional[Measurements])
-async def get_latest_measurement(client_id: str):
-    measurement_entries = [e for e in ENTRIES if e.clientId == client_id and e.type == "measurement"]
-    if not measurement_entries:
+def get_latest_measurement(client_id: str, db: read_db_dependency):
+    pointer = db.query(LatestMeasurement.measurements).filter(LatestMeasurement.clientId == client_id).first()
+    if pointer is None:
         return None
-    # Sort by date desc
-    measurement_entries.sort(key=lambda e: e.date, reverse=True)
-    return measurement_entries[0].measurements
+    return pointer.measurements
 
 
 @router.get("/{client_id}/photos", response_model=List[str])
-async def get_all_photos(client_id: str):
-    photo_entries = [e for e in ENTRIES if e.clientId == client_id and e.type == "photo"]
+def get_all_photos(client_id: str, db: read_db_dependency):
     urls: List[str] = []
-    for e in photo_entries:
+    for e in _client_entries(db, client_id, "photo").all():
         urls.extend(e.photos or [])
     return urls
 
 
 @router.get("/{client_id}/notes", response_model=List[str])
-async def get_all_notes(client_id: str):
-    note_entries = [e for e in ENTRIES if e.clientId == client_id and e.type == "note"]
-    return [e.notes for e in note_entries if e.notes]
-
-
+def get_all_notes(client_id: str, db: read_db_dependency):
+    return [e.notes for e in _client_entries(db, client_id, "note").all() if e.notes]
+
+
+@router.get("/{client_id}/series")
+def get_measurement_series(
+    client_id: str,
+    db: read_db_dependency,
+    interval: str = Query(default="week", pattern="^(week|month)$"),
+    window: int = Query(default=4, gt=0, le=52),
+):
+    columns = _measurement_columns(db, [client_id])
+    periods, means = series.resample(columns, interval)
+    return {
+        "clientId": client_id,
+        "interval": interval,
+        "periods": [str(p) for p in periods],
+        "values": series.metric_table(means),
+        "rolling": series.metric_table(series.rolling_mean(means, window)),
+        "trends": series.trend_table(series.trends(columns), 0),
+    }
@@ -1,6 +1,9 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
 from typing import Dict, List
-from datetime import datetime, timedelta
+from datetime import date, datetime, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from services.streaks import StreakBoard, StreakLog
 
 
 router = APIRouter(
@@ -9,58 +12,96 @@ router = APIRouter(
 )
 
 
-# In-memory map of userId -> list of ISO date strings (UTC midnight)
-CHECK_INS: Dict[str, List[str]] = {}
+# In-memory map of userId -> check-in days, plus the current-streak ranking.
+# Days are ordinals in the user's own timezone (UTC unless one was set).
+CHECK_INS: Dict[str, StreakLog] = {}
+TIMEZONES: Dict[str, ZoneInfo] = {}
+LEADERBOARD = StreakBoard()
 
+UTC = ZoneInfo("UTC")
+MAX_BATCH_SIZE = 500
 
-def _normalize_to_midnight_iso(dt: datetime) -> str:
-    d = dt.replace(hour=0, minute=0, second=0, microsecond=0)
-    return d.isoformat()
+
+class TimezoneRequest(BaseModel):
+    timezone: str  # IANA name, e.g. 'America/Mexico_City'
+
+
+def _today(user_id: str) -> int:
+    tz = TIMEZONES.get(user_id, UTC)
+    return datetime.now(timezone.utc).astimezone(tz).date().toordinal()
+
+
+def _ordinal_to_iso(ordinal: int) -> str:
+    return datetime.combine(date.fromordinal(ordinal), datetime.min.time()).isoformat()
+
+
+def _summary(user_id: str) -> dict:
+    log = CHECK_INS.get(user_id)
+    if log is None:
+        return {"streak": 0, "longest": 0, "lastCheckIn": None, "checkedInToday": False}
+    last = log.last
+    return {
+        "streak": log.current,
+        "longest": log.longest,
+        "lastCheckIn": _ordinal_to_iso(last) if last is not None else None,
+        "checkedInToday": last == _today(user_id),
+    }
+
+
+@router.put("/{user_id}/timezone")
+async def set_timezone(user_id: str, payload: TimezoneRequest):
+    try:
+        TIMEZONES[user_id] = ZoneInfo(payload.timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail="Unknown timezone")
+    return {"message": "Timezone updated", "timezone": payload.timezone}
 
 
 @router.post("/{user_id}/check-in")
 async def check_in(user_id: str):
-    today_iso = _normalize_to_midnight_iso(datetime.utcnow())
-    arr = CHECK_INS.get(user_id, [])
-    if today_iso not in arr:
-        arr.append(today_iso)
-        CHECK_INS[user_id] = arr
-    return {"message": "Checked in", "date": today_iso}
+    today = _today(user_id)
+    log = CHECK_INS.setdefault(user_id, StreakLog())
+    if log.check_in(today):
+        LEADERBOARD.update(user_id, log.current)
+    return {"message": "Checked in", "date": _ordinal_to_iso(today)}
+
+
+@router.get("/leaderboard")
+async def get_leaderboard(limit: int = Query(default=10, gt=0, le=100)):
+    top = LEADERBOARD.top(limit, CHECK_INS, _today)
+    return [{"userId": user_id, "streak": streak} for user_id, streak in top]
+
+
+@router.get("/batch")
+async def get_streaks_batch(userIds: List[str] = Query()):
+    # Accepts ?userIds=a&userIds=b as well as ?userIds=a,b
+    ids = list(dict.fromkeys(i for value in userIds for i in value.split(",") if i))
+    if len(ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} users per request")
+    return {user_id: _summary(user_id) for user_id in ids}
 
 
 @router.get("/{user_id}")
 async def get_streak(user_id: str):
-    arr = sorted(CHECK_INS.get(user_id, []))
-    if not arr:
-        return {"streak": 0}
-    # compute consecutive days ending at the most recent check-in
-    streak = 1
-    current = datetime.fromisoformat(arr[-1])
-    for i in range(len(arr) - 2, -1, -1):
-        prev = datetime.fromisoformat(arr[i])
-        if prev == current - timedelta(days=1):
-            streak += 1
-            current = prev
-        else:
-            break
-    return {"streak": streak}
+    # Consecutive days ending at the most recent check-in
+    log = CHECK_INS.get(user_id)
+    if log is None:
+        return {"streak": 0, "longest": 0}
+    return {"streak": log.current, "longest": log.longest}
 
 
 @router.get("/{user_id}/last-check-in")
 async def get_last_check_in(user_id: str):
-    arr = sorted(CHECK_INS.get(user_id, []))
-    return {"lastCheckIn": arr[-1] if arr else None}
+    return {"lastCheckIn": _summary(user_id)["lastCheckIn"]}
 
 
 @router.post("/{user_id}/reset")
 async def reset_streak(user_id: str):
-    CHECK_INS[user_id] = []
+    CHECK_INS[user_id] = StreakLog()
+    LEADERBOARD.discard(user_id)
     return {"message": "Streak reset"}
 
 
 @router.get("/{user_id}/has-checked-in-today")
 async def has_checked_in_today(user_id: str):
-    today_iso = _normalize_to_midnight_iso(datetime.utcnow())
-    return {"checkedIn": today_iso in CHECK_INS.get(user_id, [])}
-
-
+    return {"checkedIn": _summary(user_id)["checkedInToday"]}
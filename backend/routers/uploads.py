@@ -0,0 +1,83 @@
+import mimetypes
+import os
+from email.utils import formatdate
+from pathlib import Path
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+from starlette.concurrency import run_in_threadpool
+from services.file_cache import FileCache
+from services.response_cache import etag_matches
+from services.uploads import STORE_DIR
+
+router = APIRouter(
+    prefix="/uploads",
+    tags=["uploads"],
+)
+
+UPLOADS_ROOT = Path("uploads").resolve()
+STORE_ROOT = STORE_DIR.resolve()
+
+# Content-addressed paths never change; everything else is revalidated
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, no-cache"
+
+# Thumbnails and avatars are small and requested over and over
+CACHE = FileCache(max_bytes=64 * 1024 * 1024, max_file_bytes=256 * 1024)
+
+
+def _resolve(path: str) -> Path:
+    full = (UPLOADS_ROOT / path).resolve()
+    # Stay inside uploads/ and never expose in-progress ".part" temp files
+    if not full.is_relative_to(UPLOADS_ROOT) or full.name.startswith("."):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return full
+
+
+def _etag(full: Path, stat_result: os.stat_result) -> str:
+    if full.is_relative_to(STORE_ROOT):
+        # The filename carries the content hash (plus the variant name)
+        return f'"{full.name}"'
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def _read(full: Path) -> bytes:
+    with full.open("rb") as f:
+        return f.read()
+
+
+@router.api_route("/{path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def serve_upload(path: str, request: Request):
+    full = _resolve(path)
+    try:
+        stat_result = full.stat()
+    except (FileNotFoundError, NotADirectoryError):
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not full.is_file():
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    etag = _etag(full, stat_result)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE if full.is_relative_to(STORE_ROOT) else REVALIDATE,
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    media_type = mimetypes.guess_type(full.name)[0] or "application/octet-stream"
+    if "range" in request.headers or not CACHE.cacheable(stat_result):
+        # FileResponse streams from disk and handles Range / If-Range / 416
+        return FileResponse(full, stat_result=stat_result, media_type=media_type, headers=headers)
+
+    headers["Last-Modified"] = formatdate(stat_result.st_mtime, usegmt=True)
+    headers["Accept-Ranges"] = "bytes"
+    key = str(full)
+    data = CACHE.get(key, stat_result)
+    if data is None:
+        data = await run_in_threadpool(_read, full)
+        CACHE.put(key, stat_result, data)
+    if request.method == "HEAD":
+        headers["Content-Length"] = str(len(data))
+        return Response(status_code=200, media_type=media_type, headers=headers)
+    return Response(content=data, media_type=media_type, headers=headers)
@@ -1,7 +1,14 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, Query, status, Depends
 from pydantic import BaseModel
-from typing import List, Optional
-from datetime import datetime
+from typing import Dict, List, Optional
+from typing_extensions import Annotated
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from models.fitness import Workout as DBWorkout, WorkoutCompletion, WorkoutCompletionStats
+from settings.database import get_db, get_read_db
+from services.ids import new_id
+from services.timeutils import month_key, to_iso, week_key
+from services.upsert import insert_or_add
 
 
 router = APIRouter(
@@ -9,6 +16,9 @@ router = APIRouter(
     tags=["workouts"],
 )
 
+db_dependency = Annotated[Session, Depends(get_db)]
+read_db_dependency = Annotated[Session, Depends(get_read_db)]
+
 
 class WorkoutExercise(BaseModel):
     exerciseId: str
@@ -48,63 +58,94 @@ class UpdateWorkoutRequest(BaseModel):
     difficulty: Optional[str] = None
 
 
-# In-memory stores
-WORKOUTS: List[Workout] = []
-COMPLETED_WORKOUTS: List[dict] = []  # { id: str, userId: str, completedAt: str }
+def _to_workout(row: DBWorkout) -> Workout:
+    return Workout(
+        id=row.id,
+        name=row.name,
+        description=row.description,
+        exercises=row.exercises or [],
+        createdAt=to_iso(row.createdAt),
+        createdBy=row.createdBy,
+        duration=row.duration,
+        difficulty=row.difficulty,
+    )
+
+
+def _get_workout_or_404(db: Session, workout_id: str) -> DBWorkout:
+    row = db.query(DBWorkout).filter(DBWorkout.id == workout_id).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Workout not found")
+    return row
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
 
 
+@router.get("", response_model=List[Workout])
 @router.get("/", response_model=List[Workout])
-async def list_workouts():
-    return WORKOUTS
+def list_workouts(
+    db: read_db_dependency,
+    createdBy: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE),
+):
+    # Pages are ordered by id; pass the last id of a page as the next cursor
+    query = db.query(DBWorkout)
+    if createdBy is not None:
+        query = query.filter(DBWorkout.createdBy == createdBy)
+    if difficulty is not None:
+        query = query.filter(DBWorkout.difficulty == difficulty)
+    if cursor is not None:
+        query = query.filter(DBWorkout.id > cursor)
+    return [_to_workout(w) for w in query.order_by(DBWorkout.id).limit(limit).all()]
 
 
 @router.get("/{workout_id}", response_model=Workout)
-async def get_workout(workout_id: str):
-    for w in WORKOUTS:
-        if w.id == workout_id:
-            return w
-    raise HTTPException(status_code=404, detail="Workout not found")
+def get_workout(workout_id: str, db: read_db_dependency):
+    return _to_workout(_get_workout_or_404(db, workout_id))
 
 
 @router.post("/", response_model=Workout, status_code=status.HTTP_201_CREATED)
-async def create_workout(payload: CreateWorkoutRequest):
-    workout = Workout(
-        id=f"wkt-{int(datetime.utcnow().timestamp()*1000)}",
+def create_workout(payload: CreateWorkoutRequest, db: db_dependency):
+    workout = DBWorkout(
+        id=new_id("wkt"),
         name=payload.name,
         description=payload.description,
-        exercises=payload.exercises,
-        createdAt=datetime.utcnow().isoformat(),
+        exercises=[e.model_dump() for e in payload.exercises],
+        createdAt=datetime.utcnow(),
         createdBy=payload.createdBy,
         duration=payload.duration,
         difficulty=payload.difficulty,
     )
-    WORKOUTS.append(workout)
-    return workout
+    db.add(workout)
+    db.commit()
+    return _to_workout(workout)
 
 
 @router.put("/{workout_id}", response_model=Workout)
-async def update_workout(workout_id: str, payload: UpdateWorkoutRequest):
-    for idx, w in enumerate(WORKOUTS):
-        if w.id == workout_id:
-            updated = w.model_copy(update={
-                **({"name": payload.name} if payload.name is not None else {}),
-                **({"description": payload.description} if payload.description is not None else {}),
-                **({"exercises": payload.exercises} if payload.exercises is not None else {}),
-                **({"duration": payload.duration} if payload.duration is not None else {}),
-                **({"difficulty": payload.difficulty} if payload.difficulty is not None else {}),
-            })
-            WORKOUTS[idx] = updated
-            return updated
-    raise HTTPException(status_code=404, detail="Workout not found")
+def update_workout(workout_id: str, payload: UpdateWorkoutRequest, db: db_dependency):
+    w = _get_workout_or_404(db, workout_id)
+    if payload.name is not None:
+        w.name = payload.name
+    if payload.description is not None:
+        w.description = payload.description
+    if payload.exercises is not None:
+        w.exercises = [e.model_dump() for e in payload.exercises]
+    if payload.duration is not None:
+        w.duration = payload.duration
+    if payload.difficulty is not None:
+        w.difficulty = payload.difficulty
+    db.commit()
+    return _to_workout(w)
 
 
 @router.delete("/{workout_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_workout(workout_id: str):
-    global WORKOUTS
-    before = len(WORKOUTS)
-    WORKOUTS = [w for w in WORKOUTS if w.id != workout_id]
-    if len(WORKOUTS) == before:
+def delete_workout(workout_id: str, db: db_dependency):
+    if db.query(DBWorkout).filter(DBWorkout.id == workout_id).delete() == 0:
         raise HTTPException(status_code=404, detail="Workout not found")
+    db.commit()
     return
 
 
@@ -112,21 +153,100 @@ class CompleteWorkoutRequest(BaseModel):
     userId: str
 
 
+class CompletionPeriodSummary(BaseModel):
+    period: str  # '2024-W07' | '2024-02'
+    count: int
+    totalMinutes: int
+    difficulty: Dict[str, int]
+
+
+class CompletionSummary(BaseModel):
+    userId: str
+    weeks: List[CompletionPeriodSummary]
+    months: List[CompletionPeriodSummary]
+
+
+def _bump_completion_stats(db: Session, user_id: str, period: str, period_key: str, difficulty: str, minutes: int):
+    insert_or_add(
+        db,
+        WorkoutCompletionStats,
+        [{
+            "userId": user_id,
+            "period": period,
+            "periodKey": period_key,
+            "difficulty": difficulty,
+            "count": 1,
+            "totalMinutes": minutes,
+        }],
+        keys=["userId", "period", "periodKey", "difficulty"],
+    )
+
+
 @router.post("/{workout_id}/complete", status_code=status.HTTP_200_OK)
-async def complete_workout(workout_id: str, payload: CompleteWorkoutRequest):
-    exists = any(w.id == workout_id for w in WORKOUTS)
-    if not exists:
-        raise HTTPException(status_code=404, detail="Workout not found")
-    COMPLETED_WORKOUTS.append({
-        "id": workout_id,
-        "userId": payload.userId,
-        "completedAt": datetime.utcnow().isoformat(),
-    })
+def complete_workout(workout_id: str, payload: CompleteWorkoutRequest, db: db_dependency):
+    workout = _get_workout_or_404(db, workout_id)
+    completed_at = datetime.utcnow()
+    difficulty = workout.difficulty or "unknown"
+    minutes = workout.duration or 0
+    db.add(WorkoutCompletion(
+        workoutId=workout_id,
+        userId=payload.userId,
+        completedAt=completed_at,
+        duration=workout.duration,
+        difficulty=workout.difficulty,
+    ))
+    _bump_completion_stats(db, payload.userId, "week", week_key(completed_at), difficulty, minutes)
+    _bump_completion_stats(db, payload.userId, "month", month_key(completed_at), difficulty, minutes)
+    db.commit()
     return {"message": "Workout marked as completed"}
 
 
 @router.get("/completed/{user_id}")
-async def get_completed_workouts(user_id: str):
-    return [c for c in COMPLETED_WORKOUTS if c["userId"] == user_id]
-
-
+def get_completed_workouts(user_id: str, db: read_db_dependency):
+    rows = (
+        db.query(WorkoutCompletion)
+        .filter(WorkoutCompletion.userId == user_id)
+        .order_by(WorkoutCompletion.completedAt)
+        .all()
+    )
+    return [{"id": c.workoutId, "userId": c.userId, "completedAt": to_iso(c.completedAt)} for c in rows]
+
+
+def _period_summaries(db: Session, user_id: str, period: str, since_key: str) -> List[CompletionPeriodSummary]:
+    rows = (
+        db.query(WorkoutCompletionStats)
+        .filter(
+            WorkoutCompletionStats.userId == user_id,
+            WorkoutCompletionStats.period == period,
+            WorkoutCompletionStats.periodKey >= since_key,
+        )
+        .order_by(WorkoutCompletionStats.periodKey)
+        .all()
+    )
+    summaries: Dict[str, CompletionPeriodSummary] = {}
+    for row in rows:
+        summary = summaries.setdefault(
+            row.periodKey,
+            CompletionPeriodSummary(period=row.periodKey, count=0, totalMinutes=0, difficulty={}),
+        )
+        summary.count += row.count
+        summary.totalMinutes += row.totalMinutes
+        summary.difficulty[row.difficulty] = row.count
+    return list(summaries.values())
+
+
+@router.get("/completed/{user_id}/summary", response_model=CompletionSummary)
+def get_completed_summary(
+    user_id: str,
+    db: read_db_dependency,
+    weeks: int = Query(default=12, gt=0, le=104),
+    months: int = Query(default=12, gt=0, le=60),
+):
+    # Served from the running totals; cost depends on the window, not on history
+    now = datetime.utcnow()
+    first_month = now.year * 12 + now.month - 1 - (months - 1)
+    return CompletionSummary(
+        userId=user_id,
+        weeks=_period_summaries(db, user_id, "week", week_key(now - timedelta(weeks=weeks - 1))),
+        months=_period_summaries(db, user_id, "month", f"{first_month // 12}-{first_month % 12 + 1:02d}"),
+    )
@@ -4,6 +4,11 @@ from models.users import User
 from passlib.context import CryptContext
 from models.fitness import Workout, Appointment, BlockedTime, Message, ProgressEntry, Exercise
 from sqlalchemy.orm import Session
+from services.conversations import conversation_key
+from services.timeutils import parse_iso
+# Keep the denormalized tables in step exactly as the routers do
+from routers.messages import _bump_unread
+from routers.progress import _refresh_latest_measurement
 
 
 bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -92,7 +97,7 @@ def seed_workouts(db: Session):
             continue
         obj = Workout(
             id=item["id"], name=item["name"], description=item["description"],
-            exercises=item["exercises"], createdAt=item["createdAt"], createdBy=item["createdBy"],
+            exercises=item["exercises"], createdAt=parse_iso(item["createdAt"]), createdBy=item["createdBy"],
             duration=item["duration"], difficulty=item["difficulty"],
         )
         db.add(obj)
@@ -110,7 +115,7 @@ def seed_appointments(db: Session):
         exists = db.query(Appointment).filter(Appointment.id == item["id"]).first()
         if exists:
             continue
-        db.add(Appointment(**item))
+        db.add(Appointment(**{**item, "startTime": parse_iso(item["startTime"]), "endTime": parse_iso(item["endTime"])}))
     db.commit()
 
 
@@ -127,7 +132,13 @@ def seed_messages(db: Session):
         exists = db.query(Message).filter(Message.id == item["id"]).first()
         if exists:
             continue
-        db.add(Message(**item))
+        db.add(Message(**{
+            **item,
+            "timestamp": parse_iso(item["timestamp"]),
+            "conversationKey": conversation_key(item["senderId"], item["receiverId"]),
+        }))
+        if not item["read"]:
+            _bump_unread(db, item["receiverId"], 1)
     db.commit()
 
 
@@ -141,11 +152,17 @@ def seed_progress(db: Session):
         {"id": "prog-6", "clientId": "client-2", "date": "2023-05-15T00:00:00.000Z", "type": "measurement", "measurements": {"date": "2023-05-15T00:00:00.000Z", "weight": 80, "bodyFat": 20, "chest": 40, "waist": 34, "arms": 13, "notes": "Initial measurements"}},
         {"id": "prog-7", "clientId": "client-2", "date": "2023-06-15T00:00:00.000Z", "type": "measurement", "measurements": {"date": "2023-06-15T00:00:00.000Z", "weight": 78, "bodyFat": 18, "chest": 42, "waist": 32, "arms": 14, "notes": "One month progress - seeing good muscle development"}},
     ]
+    measured_clients = set()
     for item in entries:
         exists = db.query(ProgressEntry).filter(ProgressEntry.id == item["id"]).first()
         if exists:
             continue
-        db.add(ProgressEntry(**item))
+        db.add(ProgressEntry(**{**item, "date": parse_iso(item["date"])}))
+        if item["type"] == "measurement":
+            measured_clients.add(item["clientId"])
+    db.flush()
+    for client_id in measured_clients:
+        _refresh_latest_measurement(db, client_id)
     db.commit()
 
 
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+from heapq import merge
+from typing import Iterable, List, Tuple
+
+
+Span = Tuple[datetime, datetime]
+
+
+def full_day_span(start: datetime, end: datetime) -> Span:
+    # Widen a full-day block to whole days, covering every day it touches
+    day_start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    last = max(end - timedelta(microseconds=1), start)
+    day_end = last.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    return day_start, day_end
+
+
+def merge_busy(*sorted_spans: Iterable[Span]) -> List[Span]:
+    """Sweep already start-ordered span streams into disjoint busy intervals."""
+    merged: List[Span] = []
+    for start, end in merge(*sorted_spans):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def free_windows(window_start: datetime, window_end: datetime, busy: List[Span]) -> List[Span]:
+    free: List[Span] = []
+    cursor = window_start
+    for start, end in busy:
+        if end <= cursor:
+            continue
+        if start >= window_end:
+            break
+        if start > cursor:
+            free.append((cursor, start))
+        cursor = max(cursor, end)
+    if cursor < window_end:
+        free.append((cursor, window_end))
+    return free
+
+
+def split_slots(windows: List[Span], slot: timedelta) -> List[Span]:
+    slots: List[Span] = []
+    for start, end in windows:
+        while start + slot <= end:
+            slots.append((start, start + slot))
+            start += slot
+    return slots
@@ -0,0 +1,59 @@
+import re
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models.models import BlogTagLinks, BlogTags
+
+# Blogs.tags is free-form, e.g. "Strength, #nutrition , Mobility"
+TAG_SEPARATOR = re.compile(r"[,;]")
+
+
+def normalize_tag(raw: str) -> Optional[str]:
+    """Lower-cased tag with a leading '#' and extra whitespace removed."""
+    tag = " ".join(raw.strip().lstrip("#").split()).lower()
+    return tag or None
+
+
+def parse_tags(raw: Optional[str]) -> List[str]:
+    """Distinct normalized tags in the order they appear."""
+    tags = (normalize_tag(part) for part in TAG_SEPARATOR.split(raw or ""))
+    return list(dict.fromkeys(tag for tag in tags if tag))
+
+
+def _tag_ids(db: Session, names: List[str]) -> Dict[str, int]:
+    ids = dict(db.query(BlogTags.name, BlogTags.id).filter(BlogTags.name.in_(names)))
+    for name in names:
+        if name not in ids:
+            tag = BlogTags(name=name)
+            db.add(tag)
+            db.flush()
+            ids[name] = tag.id
+    return ids
+
+
+def set_tags(db: Session, blog_id: int, raw: Optional[str]) -> None:
+    """Replace a blog's links with the tags parsed from ``raw``."""
+    clear_tags(db, blog_id)
+    names = parse_tags(raw)
+    if names:
+        ids = _tag_ids(db, names)
+        db.add_all(BlogTagLinks(blog_id=blog_id, tag_id=ids[name]) for name in names)
+
+
+def clear_tags(db: Session, blog_id: int) -> None:
+    # Deleted explicitly: SQLite only cascades with PRAGMA foreign_keys on
+    db.query(BlogTagLinks).filter(BlogTagLinks.blog_id == blog_id).delete(synchronize_session=False)
+
+
+def tag_counts(db: Session) -> List[dict]:
+    """Every tag in use with its number of posts, most used first."""
+    count = func.count(BlogTagLinks.blog_id)
+    rows = (
+        db.query(BlogTags.name, count)
+        .join(BlogTagLinks, BlogTagLinks.tag_id == BlogTags.id)
+        .group_by(BlogTags.id, BlogTags.name)
+        .order_by(count.desc(), BlogTags.name)
+    )
+    return [{"tag": name, "count": n} for name, n in rows]
@@ -0,0 +1,4 @@
+def conversation_key(user_id: str, other_user_id: str) -> str:
+    # Same key for both directions of a conversation
+    first, second = sorted((user_id, other_user_id))
+    return f"{first}|{second}"
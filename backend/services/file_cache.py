@@ -0,0 +1,51 @@
+import os
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+class FileCache:
+    """Bounded LRU of small file contents, validated against the file's stat.
+
+    An entry is only returned while the file's mtime and size still match,
+    so files replaced on disk are never served stale. Files larger than
+    ``max_file_bytes`` are not cached; the least recently used entries are
+    evicted once the cache holds more than ``max_bytes``.
+    """
+
+    def __init__(self, max_bytes: int, max_file_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, Tuple[int, int, bytes]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def cacheable(self, stat_result: os.stat_result) -> bool:
+        return stat_result.st_size <= self.max_file_bytes
+
+    def get(self, path: str, stat_result: os.stat_result) -> Optional[bytes]:
+        entry = self._entries.get(path)
+        if entry is None:
+            return None
+        mtime_ns, size, data = entry
+        if (mtime_ns, size) != (stat_result.st_mtime_ns, stat_result.st_size):
+            self.discard(path)
+            return None
+        self._entries.move_to_end(path)
+        return data
+
+    def put(self, path: str, stat_result: os.stat_result, data: bytes) -> None:
+        if len(data) > self.max_file_bytes:
+            return
+        self.discard(path)
+        self._entries[path] = (stat_result.st_mtime_ns, stat_result.st_size, data)
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, (_, _, evicted) = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def discard(self, path: str) -> None:
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self.size -= len(entry[2])
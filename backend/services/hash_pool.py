@@ -0,0 +1,75 @@
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict
+
+
+class PoolSaturated(Exception):
+    """Raised instead of queueing when the pool already has too much work."""
+
+
+def _summary(samples: Deque[float]) -> Dict[str, float]:
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+    return {
+        "p50": round(ordered[last // 2] * 1000, 2),
+        "p95": round(ordered[int(last * 0.95)] * 1000, 2),
+        "max": round(ordered[-1] * 1000, 2),
+    }
+
+
+class HashPool:
+    """Dedicated, size-bounded thread pool for password hashing.
+
+    bcrypt releases the GIL while it works, so a few threads hash in
+    parallel without occupying the event loop. At most ``workers`` jobs run
+    and ``max_queue`` more wait; beyond that ``run`` fails fast with
+    ``PoolSaturated`` rather than letting latency grow without bound. Wait
+    and hash times of the most recent ``samples`` jobs are kept for metrics.
+    """
+
+    def __init__(self, workers: int, max_queue: int, samples: int = 1000):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hash")
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._waits: Deque[float] = deque(maxlen=samples)
+        self._hash_times: Deque[float] = deque(maxlen=samples)
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        # _pending is only touched on the event loop thread
+        if self._pending >= self.workers + self.max_queue:
+            self._rejected += 1
+            raise PoolSaturated()
+        self._pending += 1
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, self._timed, time.perf_counter(), fn, args)
+        finally:
+            self._pending -= 1
+            self._completed += 1
+
+    def _timed(self, submitted: float, fn: Callable[..., Any], args: tuple) -> Any:
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            # deque.append is atomic, so worker threads can record directly
+            self._waits.append(started - submitted)
+            self._hash_times.append(time.perf_counter() - started)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "maxQueue": self.max_queue,
+            "pending": self._pending,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "waitMs": _summary(self._waits),
+            "hashMs": _summary(self._hash_times),
+        }
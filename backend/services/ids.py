@@ -0,0 +1,95 @@
+import os
+import secrets
+import threading
+import time
+
+# Snowflake-style 64-bit ids:
+#   42 bits  milliseconds since EPOCH_MS (good until ~2163)
+#   10 bits  worker id, unique per process (KOWKA_WORKER_ID, else random)
+#   12 bits  sequence within the millisecond
+# Rendered as fixed-width Crockford base32 so string order matches numeric
+# (and therefore creation time) order.
+#
+# Set KOWKA_WORKER_ID to a distinct value per process whenever more than
+# one process or host writes to the same database. Without it each process
+# picks a random worker id and starts every millisecond's sequence at a
+# random offset, which makes clashes unlikely but not impossible.
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+# Random starting points stay in the lower half, leaving at least 2048 ids
+# per millisecond before the sequence runs out
+SEQUENCE_START_RANGE = 1 << (SEQUENCE_BITS - 1)
+
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_WIDTH = 13
+
+
+def _encode(value: int) -> str:
+    chars = []
+    for _ in range(_WIDTH):
+        chars.append(_ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+def _default_worker_id() -> int:
+    configured = os.getenv("KOWKA_WORKER_ID")
+    if configured is not None:
+        return int(configured)
+    # The pid is no good here: every single-process container tends to be pid 1
+    return secrets.randbelow(MAX_WORKER_ID + 1)
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class IdGenerator:
+    """Generator of time-sortable, strictly increasing ids.
+
+    The sequence restarts for every millisecond and counts up within it.
+    When it runs out, or the wall clock steps backwards, ids continue from
+    the last millisecond used instead, so they never go backwards. Handlers
+    run on threadpool threads, hence the lock.
+    """
+
+    def __init__(self, worker_id: int, random_start: bool = False, clock=_now_ms):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"worker_id must be between 0 and {MAX_WORKER_ID}")
+        self._worker_id = worker_id
+        self._random_start = random_start
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+
+    def _first_sequence(self) -> int:
+        return secrets.randbelow(SEQUENCE_START_RANGE) if self._random_start else 0
+
+    def next_int(self) -> int:
+        with self._lock:
+            now = self._clock() - EPOCH_MS
+            if now > self._last_ms:
+                self._last_ms = now
+                self._sequence = self._first_sequence()
+            elif self._sequence < SEQUENCE_MASK:
+                self._sequence += 1
+            else:
+                # Out of sequence numbers (or the clock went back): borrow
+                # the next millisecond
+                self._last_ms += 1
+                self._sequence = self._first_sequence()
+            return (self._last_ms << (WORKER_BITS + SEQUENCE_BITS)) | (self._worker_id << SEQUENCE_BITS) | self._sequence
+
+    def new_id(self, prefix: str) -> str:
+        return f"{prefix}-{_encode(self.next_int())}"
+
+
+_generator = IdGenerator(_default_worker_id(), random_start="KOWKA_WORKER_ID" not in os.environ)
+
+
+def new_id(prefix: str) -> str:
+    return _generator.new_id(prefix)
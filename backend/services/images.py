@@ -0,0 +1,133 @@
+import asyncio
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from fastapi import HTTPException
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Longest edge in pixels of each resized variant
+SIZES = {"thumbnail": 320, "medium": 1080}
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+# Refuse anything that would decode to more than ~100 megapixels
+Image.MAX_IMAGE_PIXELS = 50_000_000
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _executor() -> ProcessPoolExecutor:
+    # Resizing is CPU-bound, so it runs in separate processes rather than
+    # threads; created lazily so importing this module stays cheap
+    global _pool
+    if _pool is None:
+        configured = os.getenv("KOWKA_IMAGE_WORKERS")
+        workers = int(configured) if configured else min(4, os.cpu_count() or 1)
+        _pool = ProcessPoolExecutor(max_workers=workers)
+    return _pool
+
+
+def variant_filenames(filename: str) -> Dict[str, str]:
+    """Deterministic variant names for an upload, e.g. ``x.jpg`` -> ``x.thumbnail.jpg``.
+
+    JPEG sources keep JPEG fallbacks; everything else (PNG, GIF, WebP, which
+    may carry transparency) falls back to PNG. Every size also gets a WebP.
+    """
+    stem, ext = filename.rsplit(".", 1)
+    fallback = "jpg" if ext == "jpg" else "png"
+    names = {}
+    for size in SIZES:
+        names[size] = f"{stem}.{size}.{fallback}"
+        names[f"{size}Webp"] = f"{stem}.{size}.webp"
+    return names
+
+
+def _save_atomic(image: Image.Image, path: Path, **params) -> None:
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=".", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            image.save(out, **params)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def _render(source: str) -> None:
+    # Runs in a worker process
+    path = Path(source)
+    names = variant_filenames(path.name)
+    with Image.open(path) as image:
+        # Lets JPEG decode at a reduced scale instead of full resolution
+        image.draft("RGB", (SIZES["medium"], SIZES["medium"]))
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+        if names["thumbnail"].endswith(".jpg"):
+            has_alpha = False
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+    for size, edge in sorted(SIZES.items(), key=lambda item: -item[1]):
+        # Largest first, so each smaller variant is resized from the previous one
+        image.thumbnail((edge, edge), Image.LANCZOS)
+        if names[size].endswith(".jpg"):
+            _save_atomic(image, path.parent / names[size], format="JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+        else:
+            _save_atomic(image, path.parent / names[size], format="PNG", optimize=True)
+        _save_atomic(image, path.parent / names[f"{size}Webp"], format="WEBP", quality=WEBP_QUALITY, method=4)
+
+
+def discard(directory: Path, filenames: Iterable[str]) -> None:
+    """Remove uploads together with their variants."""
+    for filename in filenames:
+        for name in (filename, *variant_filenames(filename).values()):
+            try:
+                (directory / name).unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _variant_urls(url: str, names: Dict[str, str]) -> Dict[str, str]:
+    prefix = url.rsplit("/", 1)[0]
+    return {name: f"{prefix}/{variant}" for name, variant in names.items()}
+
+
+async def create_variants(path: Path, url: str) -> Dict[str, str]:
+    """Render the variants of a saved upload next to it and return their URLs.
+
+    An image that passed the magic-byte check but can't be decoded is
+    removed again and rejected with a 400.
+    """
+    names = variant_filenames(path.name)
+    if all((path.parent / name).is_file() for name in names.values()):
+        # Identical content was uploaded (and rendered) before
+        return _variant_urls(url, names)
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(_executor(), _render, str(path))
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError):
+        discard(path.parent, [path.name])
+        raise HTTPException(status_code=400, detail="Could not read image")
+    return _variant_urls(url, names)
+
+
+def existing_variants(url: str) -> Optional[Dict[str, str]]:
+    # Variant URLs of a file previously uploaded through one of the upload
+    # endpoints, if it has them
+    if not url.startswith("/uploads/") or ".." in url:
+        return None
+    path = Path(url.lstrip("/"))
+    if "." not in path.name:
+        return None
+    names = variant_filenames(path.name)
+    if not (path.parent / names["thumbnail"]).is_file():
+        return None
+    return _variant_urls(url, names)
+
+
+def thumbnail_url(url: str) -> Optional[str]:
+    variants = existing_variants(url)
+    return variants["thumbnail"] if variants else None
@@ -0,0 +1,151 @@
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+METRICS = ("weight", "bodyFat", "chest", "waist", "hips", "arms", "thighs")
+
+_DAY = np.timedelta64(1, "D")
+# numpy weeks start on Thursday (1970-01-01); Monday + 3 days is a Thursday
+_MONDAY_SHIFT = np.timedelta64(3, "D")
+
+
+class MeasurementColumns:
+    """Measurements of one or more clients as column-oriented arrays.
+
+    ``dates`` is ``datetime64[ms]``: the entry's own ``ProgressEntry.date``,
+    which entries are ordered and paginated by, not the free-form
+    ``Measurements.date`` the client sends along. ``values`` is an ``(n, len(METRICS))``
+    float matrix with NaN for metrics that weren't recorded, and ``groups``
+    maps every row to its client (index into ``client_ids``). Rows are
+    ordered by client, then date.
+    """
+
+    def __init__(self, client_ids: Sequence[str], groups: np.ndarray, dates: np.ndarray, values: np.ndarray):
+        self.client_ids = list(client_ids)
+        self.groups = groups
+        self.dates = dates
+        self.values = values
+
+    @classmethod
+    def from_rows(cls, client_ids: Sequence[str], rows) -> "MeasurementColumns":
+        # rows: (clientId, date, measurements dict) ordered by client and date
+        positions = {client_id: i for i, client_id in enumerate(client_ids)}
+        rows = list(rows)
+        groups = np.array([positions[r[0]] for r in rows], dtype=np.int64)
+        dates = np.array([r[1] for r in rows], dtype="datetime64[ms]")
+        values = np.array(
+            [[(r[2] or {}).get(metric) for metric in METRICS] for r in rows],
+            dtype=float,
+        ).reshape(len(rows), len(METRICS))
+        return cls(client_ids, groups, dates, values)
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+
+def _bucket_starts(dates: np.ndarray, interval: str) -> np.ndarray:
+    if interval == "week":
+        return ((dates + _MONDAY_SHIFT).astype("datetime64[W]") - _MONDAY_SHIFT).astype("datetime64[D]")
+    return dates.astype("datetime64[M]").astype("datetime64[D]")
+
+
+def _group_sums(groups: np.ndarray, size: int, values: np.ndarray):
+    # Per-group NaN-aware sums and counts for every metric column at once
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    sums = np.zeros((size, values.shape[1]))
+    counts = np.zeros((size, values.shape[1]))
+    np.add.at(sums, groups, filled)
+    np.add.at(counts, groups, valid)
+    return sums, counts
+
+
+def resample(columns: MeasurementColumns, interval: str):
+    """Mean of each metric per calendar week/month (single client)."""
+    buckets = _bucket_starts(columns.dates, interval)
+    periods, inverse = np.unique(buckets, return_inverse=True)
+    sums, counts = _group_sums(inverse, len(periods), columns.values)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+    return periods, means
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing NaN-aware moving average down each column."""
+    valid = ~np.isnan(values)
+    zeros = np.zeros((1, values.shape[1]))
+    sums = np.vstack([zeros, np.cumsum(np.where(valid, values, 0.0), axis=0)])
+    counts = np.vstack([zeros, np.cumsum(valid, axis=0)])
+    upper = np.arange(1, len(values) + 1)
+    lower = np.maximum(upper - window, 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (sums[upper] - sums[lower]) / (counts[upper] - counts[lower])
+
+
+def trends(columns: MeasurementColumns) -> Dict[str, np.ndarray]:
+    """Per client and metric: start, latest, delta and least-squares slope per week.
+
+    The slope is fitted on whole days, so measurements taken on the same day
+    share an x value; it is None unless a metric's points span at least one
+    day. Everything is computed for all clients in the batch with grouped
+    reductions; each returned array has shape ``(clients, len(METRICS))``.
+    """
+    size = len(columns.client_ids)
+    values = columns.values
+    valid = ~np.isnan(values)
+    days = columns.dates.astype("datetime64[D]")
+    origin = days.min() if len(columns) else np.datetime64(0, "D")
+    # Whole numbers, so the sums are exact and a single day gives a zero
+    # denominator rather than a rounding-error slope
+    x = ((days - origin) / _DAY)[:, None] * valid
+    y = np.where(valid, values, 0.0)
+
+    def group_sum(matrix):
+        out = np.zeros((size, values.shape[1]))
+        np.add.at(out, columns.groups, matrix)
+        return out
+
+    n = group_sum(valid.astype(float))
+    sx, sy = group_sum(x), group_sum(y)
+    sxx, sxy = group_sum(x * x), group_sum(x * y)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        denominator = n * sxx - sx * sx
+        slope_per_day = np.where(denominator > 0, (n * sxy - sx * sy) / denominator, np.nan)
+
+    # First/last recorded value per client and metric: rows are date-ordered,
+    # so take the minimum/maximum row index among valid rows of each group
+    rows = np.arange(len(values))[:, None]
+    first = np.full((size, values.shape[1]), len(values))
+    last = np.full((size, values.shape[1]), -1)
+    np.minimum.at(first, columns.groups, np.where(valid, rows, len(values)))
+    np.maximum.at(last, columns.groups, np.where(valid, rows, -1))
+    # Row len(values) of the padded matrix is all NaN for groups with no data
+    padded = np.vstack([values, np.full((1, values.shape[1]), np.nan)])
+    metric_index = np.arange(values.shape[1])
+    start = padded[first, metric_index]
+    latest = padded[np.where(last >= 0, last, len(values)), metric_index]
+    return {
+        "start": start,
+        "latest": latest,
+        "delta": latest - start,
+        "slopePerWeek": slope_per_day * 7,
+    }
+
+
+def _clean(value) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), 3)
+
+
+def to_list(values: np.ndarray) -> List[Optional[float]]:
+    return [_clean(v) for v in values]
+
+
+def metric_table(matrix: np.ndarray) -> Dict[str, List[Optional[float]]]:
+    return {metric: to_list(matrix[:, i]) for i, metric in enumerate(METRICS)}
+
+
+def trend_table(result: Dict[str, np.ndarray], client: int) -> Dict[str, Dict[str, Optional[float]]]:
+    return {
+        metric: {name: _clean(result[name][client, i]) for name in result}
+        for i, metric in enumerate(METRICS)
+    }
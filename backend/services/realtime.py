@@ -0,0 +1,124 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Set
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+# Queue marker telling a connection's sender loop to close the socket
+_OVERFLOW = object()
+
+
+class LocalPubSub:
+    """In-process pub/sub with the same shape a broker-backed one would have.
+
+    Every hub subscribed to a channel receives every published payload, so
+    several hubs (one per worker) can share it in tests without a broker.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[Handler]] = {}
+
+    def subscribe(self, channel: str, handler: Handler) -> None:
+        self._subscribers.setdefault(channel, []).append(handler)
+
+    def unsubscribe(self, channel: str, handler: Handler) -> None:
+        handlers = self._subscribers.get(channel, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    async def publish(self, channel: str, payload: Dict[str, Any]) -> None:
+        for handler in list(self._subscribers.get(channel, [])):
+            await handler(payload)
+
+
+class Connection:
+    def __init__(self, websocket: WebSocket, user_id: str, max_queue: int):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+    def offer(self, event: Dict[str, Any]) -> bool:
+        # Never awaits: a slow socket only fills its own queue
+        if self.overflowed:
+            return False
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(_OVERFLOW)
+            return False
+
+
+class MessageHub:
+    """Fans message events out to the websocket sessions of their recipients.
+
+    Each session has a bounded queue drained by its own sender task. A client
+    that falls ``max_queue`` events behind is disconnected (close code 1013)
+    and is expected to reconnect and catch up through the paginated REST API.
+    """
+
+    def __init__(self, pubsub: LocalPubSub, channel: str = "messages", max_queue: int = 100):
+        self._pubsub = pubsub
+        self._channel = channel
+        self._max_queue = max_queue
+        self._connections: Dict[str, Set[Connection]] = {}
+        pubsub.subscribe(channel, self._dispatch)
+
+    def connection_count(self, user_id: str) -> int:
+        return len(self._connections.get(user_id, ()))
+
+    async def publish(self, user_ids: Iterable[str], event: Dict[str, Any]) -> None:
+        await self._pubsub.publish(self._channel, {"userIds": list(dict.fromkeys(user_ids)), "event": event})
+
+    async def serve(self, websocket: WebSocket, user_id: str) -> None:
+        await websocket.accept()
+        connection = Connection(websocket, user_id, self._max_queue)
+        self._connections.setdefault(user_id, set()).add(connection)
+        sender = asyncio.create_task(self._send_loop(connection))
+        receiver = asyncio.create_task(self._receive_loop(connection))
+        try:
+            await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            sender.cancel()
+            receiver.cancel()
+            self._remove(connection)
+
+    async def _dispatch(self, payload: Dict[str, Any]) -> None:
+        event = payload["event"]
+        for user_id in payload["userIds"]:
+            for connection in list(self._connections.get(user_id, ())):
+                if not connection.offer(event):
+                    self._remove(connection)
+
+    async def _send_loop(self, connection: Connection) -> None:
+        while True:
+            event = await connection.queue.get()
+            if event is _OVERFLOW:
+                await connection.websocket.close(code=1013, reason="Client too slow")
+                return
+            await connection.websocket.send_json(event)
+
+    async def _receive_loop(self, connection: Connection) -> None:
+        # Clients don't send anything meaningful; reading detects disconnects
+        try:
+            while True:
+                await connection.websocket.receive_text()
+        except WebSocketDisconnect:
+            return
+
+    def _remove(self, connection: Connection) -> None:
+        connections = self._connections.get(connection.user_id)
+        if connections is None:
+            return
+        connections.discard(connection)
+        if not connections:
+            del self._connections[connection.user_id]
+
+
+hub = MessageHub(LocalPubSub())
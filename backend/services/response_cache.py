@@ -0,0 +1,109 @@
+import hashlib
+import itertools
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from services.ttl_cache import TTLCache
+
+# Clients may keep a copy but must revalidate it (cheap: usually a 304)
+REVALIDATE = "public, no-cache"
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # Weak comparison, as If-None-Match requires
+    if if_none_match.strip() == "*":
+        return True
+    tags = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+def _http_date(value: datetime) -> str:
+    # Naive timestamps come from the database and are UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def _modified_since(if_modified_since: str, last_modified: datetime) -> bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return True
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    # HTTP dates have whole-second resolution
+    return last_modified.replace(microsecond=0) > since
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+    last_modified: Optional[datetime] = None
+
+    def respond(self, request: Request) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": REVALIDATE}
+        if self.last_modified is not None:
+            headers["Last-Modified"] = _http_date(self.last_modified)
+        # If-Modified-Since is only consulted without If-None-Match
+        if_none_match = request.headers.get("if-none-match")
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_none_match is not None:
+            if etag_matches(if_none_match, self.etag):
+                return Response(status_code=304, headers=headers)
+        elif if_modified_since is not None and self.last_modified is not None:
+            if not _modified_since(if_modified_since, self.last_modified):
+                return Response(status_code=304, headers=headers)
+        return Response(content=self.body, media_type="application/json", headers=headers)
+
+
+class ResponseCache:
+    """Encoded JSON responses keyed by route name and the parameters it used.
+
+    Handlers take a ``key`` before reading, then ``get`` or ``put`` with it.
+    ``invalidate(route, *params)`` drops one entry and ``invalidate_route``
+    every entry of a route (all pages and filters of a listing). Both work
+    by bumping a generation that is part of the key, so a read that started
+    before a write can't store its stale result under a live key.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self._entries = TTLCache(max_entries=max_entries, ttl=ttl, clock=clock)
+        # Generations come from one counter that only ever goes up, and are
+        # never expired or evicted, so an invalidated key can't come back
+        self._counter = itertools.count(1)
+        self._generations: Dict[Hashable, int] = {}
+
+    def key(self, route: str, *params: Hashable) -> Hashable:
+        return (route, self._generations.get(route, 0), params, self._generations.get((route, params), 0))
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        return self._entries.get(key)
+
+    def put(self, key: Hashable, content: Any, last_modified: Optional[datetime] = None) -> CachedResponse:
+        # Encoded the same way FastAPI would, once per entry
+        body = JSONResponse(jsonable_encoder(content)).body
+        etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        entry = CachedResponse(body=body, etag=etag, last_modified=last_modified)
+        self._entries.set(key, entry)
+        return entry
+
+    def _bump(self, generation_key: Hashable) -> None:
+        self._generations[generation_key] = next(self._counter)
+
+    def invalidate(self, route: str, *params: Hashable) -> None:
+        self._entries.pop(self.key(route, *params))
+        self._bump((route, params))
+
+    def invalidate_route(self, route: str) -> None:
+        # Entries under the old generation age out of the LRU
+        self._bump(route)
@@ -0,0 +1,81 @@
+from array import array
+from bisect import bisect_left, insort
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class StreakLog:
+    """Check-in days for one user as run-length encoded day ordinals.
+
+    ``runs`` is a flat array of ``start, end`` pairs (inclusive, ascending),
+    so a year of daily check-ins is a single 8-byte run. Current streak,
+    longest streak and last check-in are read from the tail in O(1).
+    """
+
+    __slots__ = ("runs", "longest")
+
+    def __init__(self):
+        self.runs = array("I")
+        self.longest = 0
+
+    def check_in(self, ordinal: int) -> bool:
+        """Record a check-in; returns False if that day was already recorded."""
+        if self.runs and ordinal <= self.runs[-1]:
+            return False
+        if self.runs and ordinal == self.runs[-1] + 1:
+            self.runs[-1] = ordinal
+        else:
+            self.runs.extend((ordinal, ordinal))
+        self.longest = max(self.longest, self.current)
+        return True
+
+    @property
+    def last(self) -> Optional[int]:
+        return self.runs[-1] if self.runs else None
+
+    @property
+    def current(self) -> int:
+        # Length of the run ending at the most recent check-in
+        if not self.runs:
+            return 0
+        return self.runs[-1] - self.runs[-2] + 1
+
+    def is_active(self, today: int) -> bool:
+        # A streak survives until the end of the day after the last check-in
+        return bool(self.runs) and self.runs[-1] >= today - 1
+
+
+class StreakBoard:
+    """Users ordered by current streak, updated incrementally on check-in."""
+
+    def __init__(self):
+        self._ranking: List[Tuple[int, str]] = []
+        self._keys: Dict[str, Tuple[int, str]] = {}
+
+    def update(self, user_id: str, streak: int) -> None:
+        self.discard(user_id)
+        if streak > 0:
+            key = (-streak, user_id)
+            insort(self._ranking, key)
+            self._keys[user_id] = key
+
+    def discard(self, user_id: str) -> None:
+        key = self._keys.pop(user_id, None)
+        if key is not None:
+            pos = bisect_left(self._ranking, key)
+            del self._ranking[pos]
+
+    def top(self, limit: int, logs: Dict[str, StreakLog], today: Callable[[str], int]) -> List[Tuple[str, int]]:
+        # Walk from the top; lapsed streaks can only come back through a new
+        # check-in (which re-ranks the user), so they are dropped as we pass
+        results: List[Tuple[str, int]] = []
+        lapsed: List[str] = []
+        for negative_streak, user_id in self._ranking:
+            if len(results) >= limit:
+                break
+            if logs[user_id].is_active(today(user_id)):
+                results.append((user_id, -negative_streak))
+            else:
+                lapsed.append(user_id)
+        for user_id in lapsed:
+            self.discard(user_id)
+        return results
@@ -0,0 +1,47 @@
+import time
+from collections import deque
+from typing import Callable, Deque, Hashable
+
+from services.ttl_cache import TTLCache
+
+
+class AttemptLimiter:
+    """Sliding-window limit on failed attempts per key (account, IP, ...).
+
+    Once ``max_attempts`` failures fall within ``window`` seconds the key is
+    blocked until the oldest of them leaves the window. Keys without recent
+    failures expire on their own, and at most ``max_keys`` are tracked.
+    """
+
+    def __init__(self, max_attempts: int, window: float, max_keys: int = 100_000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_attempts = max_attempts
+        self.window = window
+        self._clock = clock
+        self._failures = TTLCache(max_entries=max_keys, ttl=window, clock=clock)
+
+    def _recent(self, key: Hashable) -> Deque[float]:
+        failures = self._failures.get(key)
+        if failures is None:
+            # Only the latest max_attempts failures matter
+            return deque(maxlen=self.max_attempts)
+        cutoff = self._clock() - self.window
+        while failures and failures[0] <= cutoff:
+            failures.popleft()
+        return failures
+
+    def retry_after(self, key: Hashable) -> float:
+        """Seconds until ``key`` may try again; 0 if it isn't blocked."""
+        failures = self._recent(key)
+        if len(failures) < self.max_attempts:
+            return 0.0
+        return failures[0] + self.window - self._clock()
+
+    def record_failure(self, key: Hashable) -> None:
+        failures = self._recent(key)
+        failures.append(self._clock())
+        # Re-setting refreshes the entry's TTL to a full window
+        self._failures.set(key, failures)
+
+    def reset(self, key: Hashable) -> None:
+        self._failures.pop(key)
@@ -0,0 +1,38 @@
+from datetime import datetime, timezone
+
+from fastapi import HTTPException
+
+
+def parse_iso(value: str) -> datetime:
+    # Accept both naive and offset/"Z" ISO strings and normalise to naive UTC
+    # so values coming from the app and from seed data compare cleanly.
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def start_of_day(value: str) -> datetime:
+    return parse_iso(value).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def to_iso(value: datetime) -> str:
+    # Same shape the app produces with Date.toISOString()
+    return value.isoformat(timespec="milliseconds") + "Z"
+
+
+def week_key(value: datetime) -> str:
+    year, week, _ = value.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def month_key(value: datetime) -> str:
+    return f"{value.year}-{value.month:02d}"
+
+
+def parse_param(value: str, field: str, parse=parse_iso) -> datetime:
+    # Malformed client input is a 400, not an unhandled ValueError
+    try:
+        return parse(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"'{field}' must be an ISO-8601 date or time")
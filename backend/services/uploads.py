@@ -0,0 +1,175 @@
+import hashlib
+import os
+import tempfile
+from collections import Counter
+from pathlib import Path
+from typing import BinaryIO, Iterable, List, Optional
+
+from fastapi import HTTPException, UploadFile
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from models.models import StoredFiles
+from services.images import discard
+
+# Uploads are content-addressed: objects/<first two hex digits>/<sha256>.<type>.
+# A path never changes content, so identical uploads share one file and
+# responses can be cached forever.
+STORE_DIR = Path("uploads/objects")
+STORE_URL = "/uploads/objects"
+STORE_DIR.mkdir(parents=True, exist_ok=True)
+
+CHUNK_SIZE = 1024 * 1024
+MB = 1024 * 1024
+
+# Largest accepted upload per detected image type
+IMAGE_LIMITS = {
+    "jpg": 15 * MB,
+    "png": 15 * MB,
+    "webp": 15 * MB,
+    "gif": 5 * MB,
+}
+
+_NAMES = {"jpg": "JPEG", "png": "PNG", "gif": "GIF", "webp": "WebP"}
+
+
+def sniff_image(head: bytes) -> Optional[str]:
+    """Image type from the file's leading bytes, or None if unrecognised."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def _invalid_type(allowed: Iterable[str]) -> HTTPException:
+    names = [_NAMES[kind] for kind in allowed]
+    listed = names[0] if len(names) == 1 else ", ".join(names[:-1]) + ", and " + names[-1]
+    return HTTPException(status_code=400, detail=f"Invalid file type. Only {listed} are allowed.")
+
+
+def _too_large(kind: str) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"{_NAMES[kind]} files can be at most {IMAGE_LIMITS[kind] // MB} MB",
+    )
+
+
+def _copy(source: BinaryIO, allowed: tuple) -> str:
+    # Runs in a worker thread: sniff the first chunk, stream the rest into a
+    # temp file while hashing it, then rename it to its content address
+    source.seek(0)
+    head = source.read(CHUNK_SIZE)
+    kind = sniff_image(head)
+    if kind not in allowed:
+        raise _invalid_type(allowed)
+    limit = IMAGE_LIMITS[kind]
+
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=STORE_DIR, prefix=".", suffix=".part")
+    try:
+        os.chmod(temp_path, 0o644)
+        written = 0
+        with os.fdopen(fd, "wb") as out:
+            chunk = head
+            while chunk:
+                written += len(chunk)
+                if written > limit:
+                    raise _too_large(kind)
+                digest.update(chunk)
+                out.write(chunk)
+                chunk = source.read(CHUNK_SIZE)
+        name = f"{digest.hexdigest()}.{kind}"
+        shard = STORE_DIR / name[:2]
+        shard.mkdir(exist_ok=True)
+        # Replacing an existing copy is harmless: the bytes are identical
+        os.replace(temp_path, shard / name)
+        return f"{STORE_URL}/{name[:2]}/{name}"
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+async def save_image(file: UploadFile, allowed: Iterable[str] = ("jpg", "png", "gif")) -> str:
+    """Store an uploaded image in the content-addressed store and return its URL.
+
+    The type comes from the file's magic bytes, not the client-supplied
+    content type or extension. The copy runs on the thread pool so large
+    uploads don't block the event loop, and stops as soon as the size limit
+    for the detected type is exceeded. Readers never see a partial file.
+    """
+    allowed = tuple(allowed)
+    if file.size is not None and file.size > max(IMAGE_LIMITS[kind] for kind in allowed):
+        # Starlette already knows the spooled size; skip the copy entirely
+        largest = max(allowed, key=IMAGE_LIMITS.get)
+        raise _too_large(largest)
+    return await run_in_threadpool(_copy, file.file, allowed)
+
+
+def path_for(url: str) -> Optional[Path]:
+    """Disk path of a stored upload, or None for anything outside the store."""
+    if not url.startswith(STORE_URL + "/"):
+        return None
+    parts = url[len(STORE_URL) + 1:].split("/")
+    if len(parts) != 2 or parts[1][:2] != parts[0] or ".." in url:
+        return None
+    return STORE_DIR / parts[0] / parts[1]
+
+
+def retain(db: Session, urls: Iterable[str]) -> None:
+    """Count one more reference for each stored URL (others are ignored)."""
+    for url, n in Counter(u for u in urls if path_for(u) is not None).items():
+        updated = (
+            db.query(StoredFiles)
+            .filter(StoredFiles.url == url)
+            .update({StoredFiles.ref_count: StoredFiles.ref_count + n}, synchronize_session=False)
+        )
+        if updated == 0:
+            db.add(StoredFiles(url=url, ref_count=n))
+
+
+def release(db: Session, urls: Iterable[str]) -> List[str]:
+    """Drop one reference per URL; returns the URLs that are now unreferenced.
+
+    Their rows are deleted in the same transaction; pass the result to
+    ``collect`` once it has committed.
+    """
+    counts = Counter(u for u in urls if path_for(u) is not None)
+    for url, n in counts.items():
+        db.query(StoredFiles).filter(StoredFiles.url == url).update(
+            {StoredFiles.ref_count: StoredFiles.ref_count - n}, synchronize_session=False
+        )
+    if not counts:
+        return []
+    orphaned = [
+        url for (url,) in db.query(StoredFiles.url)
+        .filter(StoredFiles.url.in_(counts), StoredFiles.ref_count <= 0)
+    ]
+    if orphaned:
+        db.query(StoredFiles).filter(StoredFiles.url.in_(orphaned)).delete(synchronize_session=False)
+    return orphaned
+
+
+def collect(urls: Iterable[str]) -> None:
+    """Delete unreferenced uploads and their variants from disk."""
+    for url in urls:
+        path = path_for(url)
+        if path is not None:
+            discard(path.parent, [path.name])
+
+
+def discard_unreferenced(db: Session, urls: Iterable[str]) -> None:
+    """Delete freshly saved uploads that no record has retained (yet)."""
+    urls = list(urls)
+    if not urls:
+        return
+    referenced = {url for (url,) in db.query(StoredFiles.url).filter(StoredFiles.url.in_(urls))}
+    collect(url for url in urls if url not in referenced)
+
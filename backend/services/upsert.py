@@ -0,0 +1,30 @@
+from typing import List, Sequence
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+# Dialects with INSERT ... ON CONFLICT DO UPDATE
+INSERT_FOR_DIALECT = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+
+def insert_or_add(db: Session, model, rows: List[dict], keys: Sequence[str]) -> None:
+    """Insert ``rows``, or add their other columns onto the row with the same ``keys``.
+
+    A single INSERT ... ON CONFLICT statement, so concurrent writers can't
+    both miss the row and then collide on its primary key or unique index.
+    ``keys`` must be the primary key or a unique index of ``model``.
+    """
+    if not rows:
+        return
+    table = model.__table__
+    insert = INSERT_FOR_DIALECT[db.get_bind().dialect.name]
+    statement = insert(table)
+    added = [column for column in rows[0] if column not in keys]
+    statement = statement.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={column: table.c[column] + statement.excluded[column] for column in added},
+    )
+    db.execute(statement, rows)
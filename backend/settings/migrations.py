@@ -0,0 +1,192 @@
+from sqlalchemy import DateTime, inspect, text
+from sqlalchemy.engine import Engine
+from settings.database import Base
+from services.timeutils import month_key, parse_iso, week_key
+from services.conversations import conversation_key
+from services.blog_tags import parse_tags
+
+# Columns that used to hold ISO-8601 strings (e.g. "2023-06-20T10:00:00.000Z")
+# and are now DateTime columns stored in SQLAlchemy's sortable SQLite format.
+LEGACY_ISO_COLUMNS = {
+    'workouts': ['createdAt'],
+    'appointments': ['startTime', 'endTime'],
+    'blocked_times': ['startTime', 'endTime'],
+    'messages': ['timestamp'],
+    'progress_entries': ['date'],
+}
+
+
+def _add_missing_columns(engine: Engine):
+    # create_all never alters existing tables; add new nullable columns in place
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+
+
+def _backfill_conversation_keys(engine: Engine):
+    with engine.begin() as conn:
+        rows = conn.execute(
+            text('SELECT id, "senderId", "receiverId" FROM messages WHERE "conversationKey" IS NULL')
+        ).all()
+        for row_id, sender_id, receiver_id in rows:
+            conn.execute(
+                text('UPDATE messages SET "conversationKey" = :key WHERE id = :id'),
+                {"key": conversation_key(sender_id, receiver_id), "id": row_id},
+            )
+
+
+def _backfill_unread_counters(engine: Engine):
+    with engine.begin() as conn:
+        if conn.execute(text('SELECT 1 FROM unread_counters LIMIT 1')).first() is not None:
+            return
+        # Bound, so it compares as a boolean on Postgres and as 0 on SQLite
+        conn.execute(text(
+            'INSERT INTO unread_counters ("receiverId", count) '
+            'SELECT "receiverId", COUNT(*) FROM messages WHERE read = :unread GROUP BY "receiverId"'
+        ), {"unread": False})
+
+
+def _backfill_workout_completion_stats(engine: Engine):
+    with engine.begin() as conn:
+        if conn.execute(text('SELECT 1 FROM workout_completion_stats LIMIT 1')).first() is not None:
+            return
+        conn.execute(text(
+            'UPDATE workout_completions SET '
+            'duration = (SELECT duration FROM workouts WHERE workouts.id = workout_completions."workoutId"), '
+            'difficulty = (SELECT difficulty FROM workouts WHERE workouts.id = workout_completions."workoutId") '
+            'WHERE duration IS NULL'
+        ))
+        totals = {}
+        # Typed, so completedAt comes back as a datetime on every backend
+        rows = conn.execute(
+            text('SELECT "userId", "completedAt", duration, difficulty FROM workout_completions')
+            .columns(completedAt=DateTime)
+        ).all()
+        for user_id, completed_at, duration, difficulty in rows:
+            for period, key in (('week', week_key(completed_at)), ('month', month_key(completed_at))):
+                bucket = totals.setdefault((user_id, period, key, difficulty or 'unknown'), [0, 0])
+                bucket[0] += 1
+                bucket[1] += duration or 0
+        for (user_id, period, key, difficulty), (count, minutes) in totals.items():
+            conn.execute(
+                text(
+                    'INSERT INTO workout_completion_stats ("userId", period, "periodKey", difficulty, count, "totalMinutes") '
+                    'VALUES (:user_id, :period, :key, :difficulty, :count, :minutes)'
+                ),
+                {"user_id": user_id, "period": period, "key": key, "difficulty": difficulty, "count": count, "minutes": minutes},
+            )
+
+
+def _backfill_latest_measurements(engine: Engine):
+    with engine.begin() as conn:
+        if conn.execute(text('SELECT 1 FROM latest_measurements LIMIT 1')).first() is not None:
+            return
+        conn.execute(text(
+            'INSERT INTO latest_measurements ("clientId", "entryId", date, measurements) '
+            'SELECT "clientId", id, date, measurements FROM ('
+            '  SELECT "clientId", id, date, measurements, ROW_NUMBER() OVER ('
+            '    PARTITION BY "clientId" ORDER BY date DESC, id DESC) AS position'
+            '  FROM progress_entries WHERE type = \'measurement\''
+            ') WHERE position = 1'
+        ))
+
+
+def _backfill_blog_tags(engine: Engine):
+    with engine.begin() as conn:
+        if conn.execute(text('SELECT 1 FROM blog_tag_links LIMIT 1')).first() is not None:
+            return
+        tag_ids = dict(conn.execute(text('SELECT name, id FROM blog_tags')).all())
+        rows = conn.execute(text('SELECT id, tags FROM blogs WHERE tags IS NOT NULL')).all()
+        for blog_id, tags in rows:
+            for name in parse_tags(tags):
+                if name not in tag_ids:
+                    conn.execute(text('INSERT INTO blog_tags (name) VALUES (:name)'), {"name": name})
+                    tag_ids[name] = conn.execute(
+                        text('SELECT id FROM blog_tags WHERE name = :name'), {"name": name}
+                    ).scalar_one()
+                conn.execute(
+                    text('INSERT INTO blog_tag_links (blog_id, tag_id) VALUES (:blog_id, :tag_id)'),
+                    {"blog_id": blog_id, "tag_id": tag_ids[name]},
+                )
+
+
+# Full-text index over blog posts. It's an external-content FTS5 table, so
+# the text is stored only once (in blogs); the triggers keep it in sync
+# with every insert, update and delete.
+BLOG_SEARCH_DDL = [
+    'CREATE VIRTUAL TABLE blogs_fts USING fts5('
+    '  title, description, content, author, tags,'
+    "  content='blogs', content_rowid='id', tokenize='porter unicode61')",
+    'CREATE TRIGGER blogs_fts_insert AFTER INSERT ON blogs BEGIN'
+    '  INSERT INTO blogs_fts(rowid, title, description, content, author, tags)'
+    '  VALUES (new.id, new.title, new.description, new.content, new.author, new.tags);'
+    ' END',
+    'CREATE TRIGGER blogs_fts_delete AFTER DELETE ON blogs BEGIN'
+    "  INSERT INTO blogs_fts(blogs_fts, rowid, title, description, content, author, tags)"
+    "  VALUES ('delete', old.id, old.title, old.description, old.content, old.author, old.tags);"
+    ' END',
+    'CREATE TRIGGER blogs_fts_update AFTER UPDATE ON blogs BEGIN'
+    "  INSERT INTO blogs_fts(blogs_fts, rowid, title, description, content, author, tags)"
+    "  VALUES ('delete', old.id, old.title, old.description, old.content, old.author, old.tags);"
+    '  INSERT INTO blogs_fts(rowid, title, description, content, author, tags)'
+    '  VALUES (new.id, new.title, new.description, new.content, new.author, new.tags);'
+    ' END',
+    # Index the posts that already exist
+    "INSERT INTO blogs_fts(blogs_fts) VALUES ('rebuild')",
+]
+
+
+def _create_blog_search_index(engine: Engine):
+    # Other databases fall back to LIKE matching in routers/blogs.py
+    if engine.dialect.name != 'sqlite' or inspect(engine).has_table('blogs_fts'):
+        return
+    with engine.begin() as conn:
+        for statement in BLOG_SEARCH_DDL:
+            conn.execute(text(statement))
+
+
+def _create_missing_indexes(engine: Engine):
+    # create_all only builds indexes for brand new tables
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def _normalize_iso_columns(engine: Engine):
+    # Only SQLite ever held these as strings; elsewhere they are real
+    # timestamp columns, which LIKE can't be applied to
+    if engine.dialect.name != 'sqlite':
+        return
+    with engine.begin() as conn:
+        for table, columns in LEGACY_ISO_COLUMNS.items():
+            for column in columns:
+                rows = conn.execute(
+                    text(f'SELECT id, "{column}" FROM {table} WHERE "{column}" LIKE :pattern'),
+                    {"pattern": "%T%"},
+                ).all()
+                for row_id, value in rows:
+                    normalized = parse_iso(value).strftime('%Y-%m-%d %H:%M:%S.%f')
+                    conn.execute(
+                        text(f'UPDATE {table} SET "{column}" = :value WHERE id = :id'),
+                        {"value": normalized, "id": row_id},
+                    )
+
+
+def run_migrations(engine: Engine):
+    _add_missing_columns(engine)
+    _normalize_iso_columns(engine)
+    _backfill_conversation_keys(engine)
+    _backfill_unread_counters(engine)
+    _backfill_workout_completion_stats(engine)
+    _backfill_latest_measurements(engine)
+    _backfill_blog_tags(engine)
+    _create_missing_indexes(engine)
+    _create_blog_search_index(engine)
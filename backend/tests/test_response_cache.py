@@ -0,0 +1,53 @@
+from services.response_cache import ResponseCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _read(cache, clock, at, value):
+    # A handler's read: take the key, serve the entry or store a fresh one
+    clock.now = at
+    key = cache.key("all_blogs")
+    entry = cache.get(key)
+    if entry is None:
+        entry = cache.put(key, value)
+    return entry.body
+
+
+def test_invalidated_entries_never_come_back_after_generations_age():
+    clock = FakeClock()
+    cache = ResponseCache(max_entries=100, ttl=60, clock=clock)
+
+    cache.invalidate_route("all_blogs")  # write at t=0
+    assert _read(cache, clock, 59, ["v1"]) == b'["v1"]'
+    assert _read(cache, clock, 62, ["v1"]) == b'["v1"]'
+    clock.now = 63
+    cache.invalidate_route("all_blogs")  # write at t=63
+    assert _read(cache, clock, 64, ["v2"]) == b'["v2"]'
+
+
+def test_invalidate_drops_only_that_item():
+    clock = FakeClock()
+    cache = ResponseCache(max_entries=100, ttl=60, clock=clock)
+    cache.put(cache.key("single_blog", 1), {"id": 1})
+    cache.put(cache.key("single_blog", 2), {"id": 2})
+
+    cache.invalidate("single_blog", 1)
+
+    assert cache.get(cache.key("single_blog", 1)) is None
+    assert cache.get(cache.key("single_blog", 2)) is not None
+
+
+def test_read_racing_a_write_is_not_served_afterwards():
+    clock = FakeClock()
+    cache = ResponseCache(max_entries=100, ttl=60, clock=clock)
+    key = cache.key("single_blog", 1)  # read starts
+    cache.invalidate("single_blog", 1)  # write commits
+    cache.put(key, {"title": "stale"})  # read finishes
+
+    assert cache.get(cache.key("single_blog", 1)) is None